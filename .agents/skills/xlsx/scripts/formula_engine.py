@@ -0,0 +1,1394 @@
+"""
+Pure-Python formula evaluation for recalc.py.
+
+Evaluates the formula subset our generated workbooks use without starting
+LibreOffice: arithmetic, comparison and concatenation operators, same- and
+cross-sheet references, SUM, SUMIF(S), COUNT(IF/IFS), AVERAGE, MIN, MAX,
+IF, IFERROR, AND, OR, NOT, VLOOKUP, INDEX, MATCH, ROUND(UP/DOWN), ABS and
+INT.  Formula cells are ordered by their dependency graph and each one is
+evaluated once; the results are written back as cached values in the
+worksheet XML.
+
+Anything outside that subset (other functions, defined names, array
+formulas, circular references, ...) raises UnsupportedFormula so the caller
+can fall back to LibreOffice.
+
+Usage:
+    from formula_engine import UnsupportedFormula, recalculate
+
+    try:
+        recalculate("output.xlsx")
+    except UnsupportedFormula:
+        ...  # recalculate with LibreOffice instead
+"""
+
+import math
+import os
+import re
+import tempfile
+import zipfile
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from decimal import (
+    ROUND_DOWN,
+    ROUND_HALF_UP,
+    ROUND_UP,
+    Decimal,
+    InvalidOperation,
+    localcontext,
+)
+from fnmatch import fnmatchcase
+from typing import NamedTuple
+from xml.sax.saxutils import escape
+
+import defusedxml.ElementTree
+
+from workbook_parts import local_name, shared_strings_part, worksheet_parts
+
+MAX_ROW = 1048576
+MAX_COL = 16384
+
+# Past these the workbook is left to LibreOffice: edges of the dependency
+# graph, and cells read through range references while evaluating.
+MAX_DEPENDENCY_EDGES = 4_000_000
+MAX_RANGE_CELLS = 2_000_000
+
+
+class UnsupportedFormula(Exception):
+    pass
+
+
+class ExcelError:
+    __slots__ = ("code",)
+
+    def __init__(self, code: str):
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+    def __repr__(self):
+        return self.code
+
+
+NULL = ExcelError("#NULL!")
+DIV0 = ExcelError("#DIV/0!")
+VALUE = ExcelError("#VALUE!")
+REF = ExcelError("#REF!")
+NAME = ExcelError("#NAME?")
+NUM = ExcelError("#NUM!")
+NA = ExcelError("#N/A")
+ERRORS = {e.code: e for e in (NULL, DIV0, VALUE, REF, NAME, NUM, NA)}
+
+
+# Default for optional function arguments that were not passed at all.  An
+# argument left empty evaluates to 0 and a blank cell to None, and both mean
+# FALSE/0 to Excel rather than the argument's default.
+_OMITTED = object()
+
+
+class _Fail(Exception):
+    """Carries an Excel error value out of a nested evaluation."""
+
+    def __init__(self, error: ExcelError):
+        self.error = error
+
+
+class Ref(NamedTuple):
+    sheet: str | None
+    r1: int | None
+    c1: int | None
+    r2: int | None
+    c2: int | None
+    absolute: tuple[bool, bool, bool, bool] = (False, False, False, False)
+
+    @property
+    def is_cell(self) -> bool:
+        return (
+            self.r1 is not None
+            and self.c1 is not None
+            and self.r1 == self.r2
+            and self.c1 == self.c2
+        )
+
+
+class Span(NamedTuple):
+    """The formula cells rows[lo:hi] of one column, as a single graph node."""
+
+    sheet: str
+    col: int
+    lo: int
+    hi: int
+
+
+class Range:
+    __slots__ = ("sheet", "row", "col", "rows")
+
+    def __init__(self, sheet: str, row: int, col: int, rows: list[list]):
+        self.sheet = sheet
+        self.row = row
+        self.col = col
+        self.rows = rows
+
+    @property
+    def height(self) -> int:
+        return len(self.rows)
+
+    @property
+    def width(self) -> int:
+        return len(self.rows[0]) if self.rows else 0
+
+    def values(self):
+        for row in self.rows:
+            yield from row
+
+
+# ---- parsing ---------------------------------------------------------------
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<error>\#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A))
+  | (?P<ref>
+        (?:(?P<sheet>'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?
+        (?P<address>
+            \$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?
+          | \$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}
+          | \$?\d+:\$?\d+
+        )
+        (?![\w(!.])
+    )
+  | (?P<func>(?:_xlfn\.)?[A-Za-z_][\w.]*(?=\())
+  | (?P<bool>TRUE|FALSE)(?![\w(])
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<op><>|<=|>=|[-+*/^&=<>%(),])
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
+
+_CELL_RE = re.compile(r"(\$?)([A-Za-z]{1,3})(\$?)(\d+)$")
+_COL_RE = re.compile(r"(\$?)([A-Za-z]{1,3})$")
+_ROW_RE = re.compile(r"(\$?)(\d+)$")
+
+_COMPARISONS = {"=", "<>", "<", ">", "<=", ">="}
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + ord(ch) - 64
+    return index
+
+
+def column_letters(index: int) -> str:
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def parse_formula(formula: str):
+    """Parse formula text (without the leading '=') into a small AST.
+
+    Nodes are tuples: ("lit", value), ("ref", Ref), ("func", NAME, [args]),
+    ("op", operator, left, right), ("neg", node), ("pct", node) and
+    ("missing",) for arguments left empty, as in VLOOKUP(x, t, 2, ).
+    """
+    parser = _Parser(_tokenize(formula))
+    node = parser.expression()
+    if parser.peek() is not None:
+        raise UnsupportedFormula(f"Unexpected token in formula: {formula}")
+    return node
+
+
+def _tokenize(formula: str) -> list[tuple[str, object]]:
+    tokens = []
+    pos = 0
+    while pos < len(formula):
+        match = _TOKEN_RE.match(formula, pos)
+        if not match:
+            raise UnsupportedFormula(f"Cannot parse formula: {formula}")
+        pos = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+
+        if kind == "ws":
+            continue
+        if kind == "string":
+            tokens.append(("lit", text[1:-1].replace('""', '"')))
+        elif kind == "error":
+            tokens.append(("lit", ERRORS[text.upper()]))
+        elif kind in ("ref", "address", "sheet"):
+            ref = _parse_ref(match.group("sheet"), match.group("address"))
+            tokens.append(("ref", ref))
+        elif kind == "func":
+            name = text.upper()
+            if name.startswith("_XLFN."):
+                name = name[len("_XLFN."):]
+            tokens.append(("func", name))
+        elif kind == "bool":
+            tokens.append(("lit", text.upper() == "TRUE"))
+        elif kind == "number":
+            tokens.append(("lit", float(text)))
+        else:
+            tokens.append(("op", text))
+    return tokens
+
+
+def _parse_ref(sheet: str | None, address: str) -> Ref:
+    if sheet and sheet.startswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+
+    start, _, end = address.partition(":")
+    end = end or start
+
+    cells = _CELL_RE.match(start), _CELL_RE.match(end)
+    if all(cells):
+        (ac1, c1, ar1, r1), (ac2, c2, ar2, r2) = (m.groups() for m in cells)
+        ref = Ref(
+            sheet,
+            int(r1),
+            column_index(c1),
+            int(r2),
+            column_index(c2),
+            (bool(ar1), bool(ac1), bool(ar2), bool(ac2)),
+        )
+    elif _COL_RE.match(start) and _COL_RE.match(end):
+        (ac1, c1), (ac2, c2) = (_COL_RE.match(part).groups() for part in (start, end))
+        ref = Ref(
+            sheet,
+            None,
+            column_index(c1),
+            None,
+            column_index(c2),
+            (False, bool(ac1), False, bool(ac2)),
+        )
+    elif _ROW_RE.match(start) and _ROW_RE.match(end):
+        (ar1, r1), (ar2, r2) = (_ROW_RE.match(part).groups() for part in (start, end))
+        ref = Ref(
+            sheet,
+            int(r1),
+            None,
+            int(r2),
+            None,
+            (bool(ar1), False, bool(ar2), False),
+        )
+    else:
+        raise UnsupportedFormula(f"Unsupported reference: {address}")
+
+    for value, limit in (
+        (ref.r1, MAX_ROW),
+        (ref.r2, MAX_ROW),
+        (ref.c1, MAX_COL),
+        (ref.c2, MAX_COL),
+    ):
+        if value is not None and not 1 <= value <= limit:
+            raise UnsupportedFormula(f"Unsupported reference: {address}")
+    return _normalize(ref)
+
+
+def _normalize(ref: Ref) -> Ref:
+    r1, r2 = ref.r1, ref.r2
+    c1, c2 = ref.c1, ref.c2
+    if r1 is not None and r2 is not None and r1 > r2:
+        r1, r2 = r2, r1
+    if c1 is not None and c2 is not None and c1 > c2:
+        c1, c2 = c2, c1
+    return ref._replace(r1=r1, r2=r2, c1=c1, c2=c2)
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise UnsupportedFormula("Unexpected end of formula")
+        self.pos += 1
+        return token
+
+    def accept(self, *ops) -> str | None:
+        token = self.peek()
+        if token and token[0] == "op" and token[1] in ops:
+            self.pos += 1
+            return token[1]
+        return None
+
+    def expect(self, op: str) -> None:
+        if not self.accept(op):
+            raise UnsupportedFormula(f"Expected '{op}'")
+
+    def expression(self):
+        node = self.concatenation()
+        while op := self.accept(*_COMPARISONS):
+            node = ("op", op, node, self.concatenation())
+        return node
+
+    def concatenation(self):
+        node = self.additive()
+        while self.accept("&"):
+            node = ("op", "&", node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while op := self.accept("+", "-"):
+            node = ("op", op, node, self.multiplicative())
+        return node
+
+    def multiplicative(self):
+        node = self.power()
+        while op := self.accept("*", "/"):
+            node = ("op", op, node, self.power())
+        return node
+
+    def power(self):
+        node = self.unary()
+        while self.accept("^"):
+            node = ("op", "^", node, self.unary())
+        return node
+
+    def unary(self):
+        if self.accept("-"):
+            return ("neg", self.unary())
+        if self.accept("+"):
+            return self.unary()
+        node = self.primary()
+        while self.accept("%"):
+            node = ("pct", node)
+        return node
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "lit":
+            return ("lit", value)
+        if kind == "ref":
+            return ("ref", value)
+        if kind == "func":
+            self.expect("(")
+            return ("func", value, self.arguments())
+        if kind == "op" and value == "(":
+            node = self.expression()
+            self.expect(")")
+            return node
+        raise UnsupportedFormula(f"Unexpected token '{value}'")
+
+    def arguments(self) -> list:
+        args = []
+        if self.accept(")"):
+            return args
+        while True:
+            token = self.peek()
+            if token and token[0] == "op" and token[1] in (",", ")"):
+                args.append(("missing",))
+            else:
+                args.append(self.expression())
+            if self.accept(")"):
+                return args
+            self.expect(",")
+
+
+def formula_refs(node):
+    """Yield every Ref in a parsed formula."""
+    kind = node[0]
+    if kind == "ref":
+        yield node[1]
+    elif kind == "func":
+        for arg in node[2]:
+            yield from formula_refs(arg)
+    elif kind == "op":
+        yield from formula_refs(node[2])
+        yield from formula_refs(node[3])
+    elif kind in ("neg", "pct"):
+        yield from formula_refs(node[1])
+
+
+def _shift(node, rows: int, cols: int):
+    kind = node[0]
+    if kind == "ref":
+        ref = node[1]
+        ar1, ac1, ar2, ac2 = ref.absolute
+
+        def move(value, absolute, delta):
+            if value is None or absolute:
+                return value
+            value += delta
+            if value < 1:
+                raise UnsupportedFormula("Shared formula shifts off the sheet")
+            return value
+
+        return ("ref", ref._replace(
+            r1=move(ref.r1, ar1, rows),
+            c1=move(ref.c1, ac1, cols),
+            r2=move(ref.r2, ar2, rows),
+            c2=move(ref.c2, ac2, cols),
+        ))
+    if kind == "func":
+        return ("func", node[1], [_shift(arg, rows, cols) for arg in node[2]])
+    if kind == "op":
+        return ("op", node[1], _shift(node[2], rows, cols), _shift(node[3], rows, cols))
+    if kind in ("neg", "pct"):
+        return (kind, _shift(node[1], rows, cols))
+    return node
+
+
+# ---- workbook model --------------------------------------------------------
+
+
+class Workbook:
+    """Cell values and parsed formulas of every worksheet in a package.
+
+    With strict=False, formulas and values the engine cannot handle are
+    skipped (and counted in `unparsed`) instead of raising, which is enough
+    for analysing the dependency structure.
+    """
+
+    def __init__(self, filename, strict: bool = True):
+        self.filename = filename
+        self.strict = strict
+        self.unparsed = 0
+        self.truncated = False
+        self.sheets: list[tuple[str, str]] = []
+        self.values: dict[str, dict[tuple[int, int], object]] = {}
+        self.formulas: dict[tuple[str, int, int], tuple] = {}
+        self.max_row: dict[str, int] = {}
+        self.max_col: dict[str, int] = {}
+        self._sheet_names: dict[str, str] = {}
+
+        with zipfile.ZipFile(filename) as zf:
+            self.sheets = worksheet_parts(zf)
+            shared = _read_shared_strings(zf)
+            for sheet_name, part in self.sheets:
+                self._sheet_names[sheet_name.lower()] = sheet_name
+                self._load_sheet(zf, sheet_name, part, shared)
+
+    def sheet(self, name: str | None, current: str) -> str:
+        if name is None:
+            return current
+        try:
+            return self._sheet_names[name.lower()]
+        except KeyError:
+            raise UnsupportedFormula(f"Reference to unknown sheet '{name}'")
+
+    def formula_index(self) -> dict[str, dict[int, list[int]]]:
+        """sheet -> column -> sorted rows holding formulas."""
+        index = defaultdict(lambda: defaultdict(list))
+        for sheet, row, col in self.formulas:
+            index[sheet][col].append(row)
+        for columns in index.values():
+            for rows in columns.values():
+                rows.sort()
+        return index
+
+    def dependencies(self, max_edges: int = MAX_DEPENDENCY_EDGES) -> dict:
+        """Map each formula cell, and each Span node, to the nodes it reads.
+
+        A range reference does not link to every formula cell it covers:
+        each column's formula rows form a segment tree of Span nodes, and a
+        range links to the O(log n) spans covering it.  Ranges that grow
+        row by row, like running totals, so stay near-linear in edges.
+
+        Past `max_edges` this raises UnsupportedFormula; with strict=False
+        it stops early and sets `truncated` instead.
+        """
+        index = self.formula_index()
+        graph = {}
+        edges = 0
+
+        def span(sheet, col, rows, lo, hi):
+            nonlocal edges
+            if hi - lo == 1:
+                return (sheet, rows[lo], col)
+            node = Span(sheet, col, lo, hi)
+            if node not in graph:
+                mid = (lo + hi) // 2
+                graph[node] = {
+                    span(sheet, col, rows, lo, mid),
+                    span(sheet, col, rows, mid, hi),
+                }
+                edges += 2
+            return node
+
+        def cover(sheet, col, rows, lo, hi, node_lo, node_hi):
+            if lo <= node_lo and node_hi <= hi:
+                yield span(sheet, col, rows, node_lo, node_hi)
+                return
+            mid = (node_lo + node_hi) // 2
+            if lo < mid:
+                yield from cover(sheet, col, rows, lo, hi, node_lo, mid)
+            if hi > mid:
+                yield from cover(sheet, col, rows, lo, hi, mid, node_hi)
+
+        for cell, node in self.formulas.items():
+            precedents = set()
+            for ref in formula_refs(node):
+                try:
+                    for sheet, col, rows, lo, hi in self.formula_rows_in(
+                        ref, cell[0], index
+                    ):
+                        precedents.update(cover(sheet, col, rows, lo, hi, 0, len(rows)))
+                except UnsupportedFormula:
+                    if self.strict:
+                        raise
+            graph[cell] = precedents
+            edges += len(precedents)
+            if edges > max_edges:
+                if self.strict:
+                    raise UnsupportedFormula(
+                        f"Dependency graph exceeds {max_edges} edges"
+                    )
+                self.truncated = True
+                break
+        return graph
+
+    def formula_rows_in(self, ref: Ref, current: str, index):
+        """Yield (sheet, col, rows, lo, hi) where rows[lo:hi] are in `ref`."""
+        sheet = self.sheet(ref.sheet, current)
+        columns = index.get(sheet)
+        if not columns:
+            return
+        r1, r2 = ref.r1 or 1, ref.r2 or MAX_ROW
+        c1, c2 = ref.c1 or 1, ref.c2 or MAX_COL
+        for col, rows in columns.items():
+            if c1 <= col <= c2:
+                lo, hi = bisect_left(rows, r1), bisect_right(rows, r2)
+                if lo < hi:
+                    yield sheet, col, rows, lo, hi
+
+    def _load_sheet(self, zf, sheet_name, part, shared):
+        values = self.values[sheet_name] = {}
+        shared_formulas = {}
+        max_row = max_col = 0
+        sheet_data = None
+
+        with zf.open(part) as f:
+            events = defusedxml.ElementTree.iterparse(f, events=("start", "end"))
+            for event, elem in events:
+                tag = local_name(elem.tag)
+                if event == "start":
+                    if tag == "sheetData":
+                        sheet_data = elem
+                    continue
+                if tag == "row" and sheet_data is not None:
+                    sheet_data.remove(elem)
+                if tag != "c":
+                    continue
+
+                match = _CELL_RE.match(elem.get("r") or "")
+                if not match:
+                    raise UnsupportedFormula(f"Cell without reference in {part}")
+                row, col = int(match.group(4)), column_index(match.group(2))
+                max_row, max_col = max(max_row, row), max(max_col, col)
+
+                formula = value = text = None
+                for child in elem:
+                    child_tag = local_name(child.tag)
+                    if child_tag == "f":
+                        formula = child
+                    elif child_tag == "v":
+                        value = child.text
+                    elif child_tag == "is":
+                        text = _rich_text(child)
+
+                try:
+                    if formula is not None:
+                        node = self._parse_cell_formula(
+                            formula, row, col, shared_formulas
+                        )
+                        self.formulas[(sheet_name, row, col)] = node
+                        values[(row, col)] = None
+                    else:
+                        values[(row, col)] = _cell_value(
+                            elem.get("t"), value, text, shared
+                        )
+                except UnsupportedFormula:
+                    if self.strict:
+                        raise
+                    self.unparsed += formula is not None
+                    values[(row, col)] = value
+
+        self.max_row[sheet_name] = max_row
+        self.max_col[sheet_name] = max_col
+
+    def _parse_cell_formula(self, formula, row, col, shared_formulas):
+        kind = formula.get("t", "normal")
+        if kind == "normal":
+            return parse_formula(formula.text or "")
+        if kind != "shared":
+            raise UnsupportedFormula(f"Unsupported {kind} formula")
+
+        index = formula.get("si")
+        if formula.text:
+            node = parse_formula(formula.text)
+            shared_formulas[index] = (node, row, col)
+            return node
+        if index not in shared_formulas:
+            raise UnsupportedFormula("Shared formula used before its definition")
+        node, base_row, base_col = shared_formulas[index]
+        return _shift(node, row - base_row, col - base_col)
+
+
+def _read_shared_strings(zf) -> list[str]:
+    part = shared_strings_part(zf)
+    if part is None:
+        return []
+    strings = []
+    with zf.open(part) as f:
+        for _, elem in defusedxml.ElementTree.iterparse(f):
+            if local_name(elem.tag) == "si":
+                strings.append(_rich_text(elem))
+                elem.clear()
+    return strings
+
+
+def _rich_text(elem) -> str:
+    parts = []
+    for child in elem:
+        tag = local_name(child.tag)
+        if tag == "t":
+            parts.append(child.text or "")
+        elif tag == "r":
+            parts.extend(t.text or "" for t in child if local_name(t.tag) == "t")
+    return "".join(parts)
+
+
+def _cell_value(cell_type, value, text, shared):
+    if cell_type == "inlineStr":
+        return text or ""
+    if value is None:
+        return None
+    if cell_type == "s":
+        return shared[int(value)]
+    if cell_type == "str":
+        return value
+    if cell_type == "b":
+        return value.strip() == "1"
+    if cell_type == "e":
+        return ERRORS.get(value, ExcelError(value))
+    if cell_type == "d":
+        raise UnsupportedFormula("ISO 8601 date cells are not supported")
+    return float(value)
+
+
+# ---- evaluation ------------------------------------------------------------
+
+
+def evaluation_order(workbook: Workbook) -> list[tuple[str, int, int]]:
+    """Formula cells in an order where every precedent comes first."""
+    graph = workbook.dependencies()
+    dependents = defaultdict(list)
+    pending = {}
+    for cell, precedents in graph.items():
+        pending[cell] = len(precedents)
+        for precedent in precedents:
+            dependents[precedent].append(cell)
+
+    ready = deque(cell for cell, count in pending.items() if count == 0)
+    order = []
+    visited = 0
+    while ready:
+        cell = ready.popleft()
+        visited += 1
+        if not isinstance(cell, Span):
+            order.append(cell)
+        for dependent in dependents[cell]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+
+    if visited != len(graph):
+        raise UnsupportedFormula("Circular reference")
+    return order
+
+
+class Evaluator:
+    def __init__(self, workbook: Workbook):
+        self.workbook = workbook
+        self._ranges: dict[tuple, Range] = {}
+
+    def run(self) -> dict[tuple[str, int, int], object]:
+        self._check_range_cells()
+        results = {}
+        for cell in evaluation_order(self.workbook):
+            sheet, row, col = cell
+            value = self.evaluate_cell(self.workbook.formulas[cell], sheet)
+            self.workbook.values[sheet][(row, col)] = value
+            results[cell] = value
+        return results
+
+    def evaluate_cell(self, node, sheet):
+        try:
+            value = self.scalar(node, sheet)
+        except _Fail as e:
+            return e.error
+        if value is None:
+            return 0.0
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return NUM
+        return value
+
+    def evaluate(self, node, sheet):
+        kind = node[0]
+        if kind == "lit":
+            return node[1]
+        if kind == "ref":
+            return self.reference(node[1], sheet)
+        if kind == "func":
+            return self.call(node[1], node[2], sheet)
+        if kind == "op":
+            left = self.scalar(node[2], sheet)
+            return _binary(node[1], left, self.scalar(node[3], sheet))
+        if kind == "neg":
+            return -_to_number(self.scalar(node[1], sheet))
+        if kind == "pct":
+            return _to_number(self.scalar(node[1], sheet)) / 100
+        if kind == "missing":
+            return 0.0
+        return None
+
+    def scalar(self, node, sheet):
+        value = self.evaluate(node, sheet)
+        if isinstance(value, Range):
+            if value.height == 1 and value.width == 1:
+                return value.rows[0][0]
+            raise UnsupportedFormula("Implicit intersection is not supported")
+        return value
+
+    def reference(self, ref: Ref, sheet: str):
+        target = self.workbook.sheet(ref.sheet, sheet)
+        if ref.is_cell:
+            return self.workbook.values[target].get((ref.r1, ref.c1))
+
+        return self.range(*self._bounds(ref, target))
+
+    def _bounds(self, ref: Ref, target: str) -> tuple[str, int, int, int, int]:
+        r1, r2 = ref.r1 or 1, ref.r2 or max(self.workbook.max_row[target], 1)
+        c1, c2 = ref.c1 or 1, ref.c2 or max(self.workbook.max_col[target], 1)
+        return target, r1, c1, r2, c2
+
+    def _check_range_cells(self) -> None:
+        # Each distinct range is read cell by cell once, so ranges that grow
+        # row by row cost quadratic time; leave those to LibreOffice.
+        ranges = set()
+        for (sheet, _, _), node in self.workbook.formulas.items():
+            for ref in formula_refs(node):
+                if not ref.is_cell:
+                    target = self.workbook.sheet(ref.sheet, sheet)
+                    ranges.add(self._bounds(ref, target))
+        cells = sum((r2 - r1 + 1) * (c2 - c1 + 1) for _, r1, c1, r2, c2 in ranges)
+        if cells > MAX_RANGE_CELLS:
+            raise UnsupportedFormula(f"Ranges cover more than {MAX_RANGE_CELLS} cells")
+
+    def range(self, sheet, r1, c1, r2, c2) -> Range:
+        # Precedents are always evaluated first, so a range never changes
+        # once something has read it.
+        key = (sheet, r1, c1, r2, c2)
+        cached = self._ranges.get(key)
+        if cached is None:
+            values = self.workbook.values[sheet]
+            cols = range(c1, c2 + 1)
+            rows = [[values.get((r, c)) for c in cols] for r in range(r1, r2 + 1)]
+            cached = self._ranges[key] = Range(sheet, r1, c1, rows)
+        return cached
+
+    def call(self, name: str, args: list, sheet: str):
+        if name == "IF":
+            _arity(name, args, 2, 3)
+            condition = _to_bool(self.scalar(args[0], sheet))
+            if len(args) == 2 and not condition:
+                return False
+            branch = args[1] if condition else args[2]
+            return self.evaluate(branch, sheet)
+        if name == "IFERROR":
+            _arity(name, args, 2, 2)
+            try:
+                value = self.scalar(args[0], sheet)
+            except _Fail:
+                value = VALUE
+            if isinstance(value, ExcelError):
+                return self.evaluate(args[1], sheet)
+            return value
+
+        function = _FUNCTIONS.get(name)
+        if function is None:
+            raise UnsupportedFormula(f"Unsupported function {name}")
+        values = [self.evaluate(arg, sheet) for arg in args]
+        try:
+            return function(self, *values)
+        except TypeError:
+            raise UnsupportedFormula(f"{name} called with {len(args)} arguments")
+
+
+def _arity(name, args, low, high):
+    if not low <= len(args) <= high:
+        raise UnsupportedFormula(f"{name} called with {len(args)} arguments")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _to_number(value) -> float:
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return float(value)
+    if _is_number(value):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            raise _Fail(VALUE)
+    if isinstance(value, ExcelError):
+        raise _Fail(value)
+    raise _Fail(VALUE)
+
+
+def _to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if _is_number(value):
+        return _format_number(value)
+    if isinstance(value, ExcelError):
+        raise _Fail(value)
+    return value
+
+
+def _to_bool(value) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    if _is_number(value):
+        return value != 0
+    if isinstance(value, str) and value.upper() in ("TRUE", "FALSE"):
+        return value.upper() == "TRUE"
+    if isinstance(value, ExcelError):
+        raise _Fail(value)
+    raise _Fail(VALUE)
+
+
+def _format_number(value: float) -> str:
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return format(value, ".15g")
+
+
+def _binary(op, left, right):
+    if op == "&":
+        return _to_text(left) + _to_text(right)
+    if op in _COMPARISONS:
+        for value in (left, right):
+            if isinstance(value, ExcelError):
+                raise _Fail(value)
+        order = _compare(left, right)
+        return {
+            "=": order == 0,
+            "<>": order != 0,
+            "<": order < 0,
+            ">": order > 0,
+            "<=": order <= 0,
+            ">=": order >= 0,
+        }[op]
+
+    a, b = _to_number(left), _to_number(right)
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        if b == 0:
+            raise _Fail(DIV0)
+        return a / b
+    if a == 0 and b < 0:
+        raise _Fail(DIV0)
+    try:
+        result = a ** b
+    except OverflowError:
+        raise _Fail(NUM)
+    if isinstance(result, complex):
+        raise _Fail(NUM)
+    return result
+
+
+def _type_rank(value) -> int:
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, str):
+        return 1
+    return 0
+
+
+def _blank_like(value):
+    if isinstance(value, str):
+        return ""
+    if isinstance(value, bool):
+        return False
+    return 0.0
+
+
+def _compare(left, right) -> int:
+    if left is None:
+        left = _blank_like(right)
+    if right is None:
+        right = _blank_like(left)
+
+    rank_left, rank_right = _type_rank(left), _type_rank(right)
+    if rank_left != rank_right:
+        return -1 if rank_left < rank_right else 1
+    if isinstance(left, str):
+        left, right = left.lower(), right.lower()
+    return (left > right) - (left < right)
+
+
+def _check(value):
+    if isinstance(value, ExcelError):
+        raise _Fail(value)
+    return value
+
+
+def _numbers(args):
+    """Numbers from SUM-style arguments.
+
+    Cells in ranges contribute only when numeric; direct arguments are
+    coerced, so TRUE counts as 1 and "3" as 3.
+    """
+    for arg in args:
+        if isinstance(arg, Range):
+            for value in arg.values():
+                if _is_number(_check(value)):
+                    yield float(value)
+        elif arg is not None:
+            yield _to_number(arg)
+
+
+def _fn_sum(ev, *args):
+    return math.fsum(_numbers(args))
+
+
+def _fn_average(ev, *args):
+    numbers = list(_numbers(args))
+    if not numbers:
+        raise _Fail(DIV0)
+    return math.fsum(numbers) / len(numbers)
+
+
+def _fn_min(ev, *args):
+    return min(_numbers(args), default=0.0)
+
+
+def _fn_max(ev, *args):
+    return max(_numbers(args), default=0.0)
+
+
+def _fn_count(ev, *args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, Range):
+            count += sum(1 for value in arg.values() if _is_number(value))
+        elif arg is not None and not isinstance(arg, ExcelError):
+            try:
+                _to_number(arg)
+                count += 1
+            except _Fail:
+                pass
+    return float(count)
+
+
+def _fn_counta(ev, *args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, Range):
+            count += sum(1 for value in arg.values() if value is not None)
+        elif arg is not None:
+            count += 1
+    return float(count)
+
+
+def _criteria(criteria):
+    """Build a predicate for SUMIF/COUNTIF style criteria."""
+    _check(criteria)
+    op, operand = "=", criteria
+    if isinstance(criteria, str):
+        match = re.match(r"(<=|>=|<>|<|>|=)?(.*)", criteria, re.S)
+        op, operand = match.group(1) or "=", match.group(2)
+        try:
+            operand = float(operand)
+        except ValueError:
+            if operand.upper() in ("TRUE", "FALSE"):
+                operand = operand.upper() == "TRUE"
+
+    if isinstance(operand, str):
+        pattern = operand.lower()
+        wildcard = any(ch in pattern for ch in "*?")
+
+        def matches(value):
+            if pattern == "":
+                return value is None or value == ""
+            if not isinstance(value, str):
+                return False
+            value = value.lower()
+            return fnmatchcase(value, pattern) if wildcard else value == pattern
+
+        if op == "=":
+            return matches
+        if op == "<>":
+            return lambda value: not matches(value)
+
+        def compare_text(value):
+            return isinstance(value, str) and _binary(op, value, operand)
+
+        return compare_text
+
+    if operand is None:
+        operand = 0.0
+
+    def compare(value):
+        if isinstance(value, ExcelError):
+            return op == "<>"
+        if _type_rank(value) != _type_rank(operand) or value is None:
+            return op == "<>"
+        return _binary(op, value, operand)
+
+    return compare
+
+
+def _as_range(value) -> Range:
+    if not isinstance(value, Range):
+        raise UnsupportedFormula("Expected a range argument")
+    return value
+
+
+def _fn_sumif(ev, rng, criteria, sum_range=_OMITTED):
+    rng = _as_range(rng)
+    if sum_range is _OMITTED:
+        sum_range = rng
+    else:
+        sum_range = _as_range(sum_range)
+        # Excel resizes sum_range to match the criteria range, which reads
+        # cells outside the references the dependency graph knows about.
+        if (sum_range.height, sum_range.width) != (rng.height, rng.width):
+            raise UnsupportedFormula("SUMIF sum_range must match the criteria range")
+    matches = _criteria(criteria)
+    total = []
+    for row, sum_row in zip(rng.rows, sum_range.rows):
+        for value, addend in zip(row, sum_row):
+            if matches(value) and _is_number(_check(addend)):
+                total.append(addend)
+    return math.fsum(total)
+
+
+def _conditions(pairs):
+    if len(pairs) % 2 or not pairs:
+        raise UnsupportedFormula("Criteria arguments must come in pairs")
+    ranges = [_as_range(r) for r in pairs[::2]]
+    predicates = [_criteria(c) for c in pairs[1::2]]
+    shape = (ranges[0].height, ranges[0].width)
+    if any((r.height, r.width) != shape for r in ranges):
+        raise _Fail(VALUE)
+
+    for i in range(shape[0]):
+        for j in range(shape[1]):
+            if all(p(r.rows[i][j]) for r, p in zip(ranges, predicates)):
+                yield i, j
+
+
+def _fn_sumifs(ev, sum_range, *pairs):
+    sum_range = _as_range(sum_range)
+    total = []
+    for i, j in _conditions(pairs):
+        if i >= sum_range.height or j >= sum_range.width:
+            raise _Fail(VALUE)
+        value = _check(sum_range.rows[i][j])
+        if _is_number(value):
+            total.append(value)
+    return math.fsum(total)
+
+
+def _fn_countif(ev, rng, criteria):
+    matches = _criteria(criteria)
+    return float(sum(1 for value in _as_range(rng).values() if matches(value)))
+
+
+def _fn_countifs(ev, *pairs):
+    return float(sum(1 for _ in _conditions(pairs)))
+
+
+def _fn_and(ev, *args):
+    return all(_logicals(args))
+
+
+def _fn_or(ev, *args):
+    return any(_logicals(args))
+
+
+def _logicals(args):
+    values = []
+    for arg in args:
+        if isinstance(arg, Range):
+            values.extend(
+                _to_bool(v)
+                for v in arg.values()
+                if isinstance(_check(v), (bool, int, float))
+            )
+        else:
+            values.append(_to_bool(arg))
+    if not values:
+        raise _Fail(VALUE)
+    return values
+
+
+def _fn_not(ev, value):
+    return not _to_bool(value)
+
+
+def _round(value, digits, rounding):
+    number = Decimal(repr(_to_number(value)))
+    # A float has no digits beyond these places, so clamping them changes
+    # nothing but keeps the precision below within reason.
+    places = max(-400, min(400, int(_to_number(digits))))
+    quantum = Decimal(1).scaleb(-places)
+    with localcontext() as context:
+        # quantize() needs every digit of the result within the precision.
+        context.prec = max(context.prec, number.adjusted() + places + 2)
+        try:
+            return float(number.quantize(quantum, rounding=rounding))
+        except InvalidOperation:
+            raise UnsupportedFormula(f"Cannot round {number}")
+
+
+def _fn_round(ev, value, digits=0.0):
+    return _round(value, digits, ROUND_HALF_UP)
+
+
+def _fn_roundup(ev, value, digits=0.0):
+    return _round(value, digits, ROUND_UP)
+
+
+def _fn_rounddown(ev, value, digits=0.0):
+    return _round(value, digits, ROUND_DOWN)
+
+
+def _fn_abs(ev, value):
+    return abs(_to_number(value))
+
+
+def _fn_int(ev, value):
+    return float(math.floor(_to_number(value)))
+
+
+def _lookup_equal(value, target) -> bool:
+    if value is None or isinstance(value, ExcelError):
+        return False
+    if _type_rank(value) != _type_rank(target):
+        return False
+    if isinstance(value, str):
+        target = target.lower()
+        value = value.lower()
+        if any(ch in target for ch in "*?"):
+            return fnmatchcase(value, target)
+    return value == target
+
+
+def _exact_position(values, target) -> int | None:
+    return next((i for i, v in enumerate(values) if _lookup_equal(v, target)), None)
+
+
+def _approximate_position(values, target, descending=False) -> int | None:
+    position = None
+    for i, value in enumerate(values):
+        if value is None or _type_rank(value) != _type_rank(target):
+            continue
+        order = _compare(value, target)
+        if (order <= 0) if not descending else (order >= 0):
+            position = i
+            if order == 0 and not descending:
+                continue
+        else:
+            break
+    return position
+
+
+def _fn_vlookup(ev, target, table, column, approximate=_OMITTED):
+    target = _check(target)
+    table = _as_range(table)
+    column = int(_to_number(column))
+    if column < 1:
+        raise _Fail(VALUE)
+    if column > table.width:
+        raise _Fail(REF)
+
+    keys = [row[0] for row in table.rows]
+    if approximate is _OMITTED or _to_bool(approximate):
+        position = _approximate_position(keys, target)
+    else:
+        position = _exact_position(keys, target)
+
+    if position is None:
+        raise _Fail(NA)
+    return table.rows[position][column - 1]
+
+
+def _fn_index(ev, array, row, column=_OMITTED):
+    array = _as_range(array)
+    row = int(_to_number(row))
+    column = int(_to_number(column)) if column is not _OMITTED else None
+
+    if column is None:
+        if array.height == 1:
+            row, column = 1, row
+        elif array.width == 1:
+            column = 1
+        else:
+            raise UnsupportedFormula("INDEX without a column on a 2D range")
+    if row == 0 or column == 0:
+        raise UnsupportedFormula("INDEX returning a whole row or column")
+    if not (1 <= row <= array.height and 1 <= column <= array.width):
+        raise _Fail(REF)
+    return array.rows[row - 1][column - 1]
+
+
+def _fn_match(ev, target, array, match_type=_OMITTED):
+    target = _check(target)
+    array = _as_range(array)
+    if array.height != 1 and array.width != 1:
+        raise _Fail(NA)
+    values = list(array.values())
+
+    kind = int(_to_number(match_type)) if match_type is not _OMITTED else 1
+    if kind == 0:
+        position = _exact_position(values, target)
+    else:
+        position = _approximate_position(values, target, descending=kind < 0)
+
+    if position is None:
+        raise _Fail(NA)
+    return float(position + 1)
+
+
+_FUNCTIONS = {
+    "SUM": _fn_sum,
+    "AVERAGE": _fn_average,
+    "MIN": _fn_min,
+    "MAX": _fn_max,
+    "COUNT": _fn_count,
+    "COUNTA": _fn_counta,
+    "SUMIF": _fn_sumif,
+    "SUMIFS": _fn_sumifs,
+    "COUNTIF": _fn_countif,
+    "COUNTIFS": _fn_countifs,
+    "AND": _fn_and,
+    "OR": _fn_or,
+    "NOT": _fn_not,
+    "ROUND": _fn_round,
+    "ROUNDUP": _fn_roundup,
+    "ROUNDDOWN": _fn_rounddown,
+    "ABS": _fn_abs,
+    "INT": _fn_int,
+    "VLOOKUP": _fn_vlookup,
+    "INDEX": _fn_index,
+    "MATCH": _fn_match,
+}
+
+SUPPORTED_FUNCTIONS = frozenset(_FUNCTIONS) | {"IF", "IFERROR"}
+
+
+# ---- writing results back --------------------------------------------------
+
+_XML_CELL_RE = re.compile(rb"<c\b([^>]*?)(?<!/)>(.*?)</c>", re.S)
+_XML_REF_RE = re.compile(rb'\sr="([A-Za-z]+)(\d+)"')
+_XML_TYPE_RE = re.compile(rb'\st="[^"]*"')
+_XML_VALUE_RE = re.compile(rb"<v>.*?</v>|<v/>", re.S)
+_XML_FORMULA_RE = re.compile(rb"<f\b[^>]*/>|<f\b[^>]*>.*?</f>", re.S)
+
+
+def _cached_value(value) -> tuple[bytes | None, bytes]:
+    if isinstance(value, ExcelError):
+        return b"e", value.code.encode()
+    if isinstance(value, bool):
+        return b"b", b"1" if value else b"0"
+    if isinstance(value, str):
+        return b"str", escape(value).encode("utf-8")
+    number = float(value)
+    if number.is_integer() and abs(number) < 1e15:
+        return None, str(int(number)).encode()
+    return None, repr(number).encode()
+
+
+def _write_sheet(data: bytes, results: dict[tuple[int, int], object]) -> bytes:
+    written = 0
+
+    def replace(match):
+        nonlocal written
+        attrs, inner = match.group(1), match.group(2)
+        ref = _XML_REF_RE.search(attrs)
+        if not ref:
+            return match.group(0)
+        key = (int(ref.group(2)), column_index(ref.group(1).decode()))
+        if key not in results:
+            return match.group(0)
+
+        cell_type, text = _cached_value(results[key])
+        attrs = _XML_TYPE_RE.sub(b"", attrs)
+        if cell_type:
+            attrs += b' t="' + cell_type + b'"'
+        inner = _XML_VALUE_RE.sub(b"", inner)
+        formula = _XML_FORMULA_RE.search(inner)
+        if not formula:
+            return match.group(0)
+        inner = inner[: formula.end()] + b"<v>" + text + b"</v>" + inner[formula.end():]
+        written += 1
+        return b"<c" + attrs + b">" + inner + b"</c>"
+
+    output = _XML_CELL_RE.sub(replace, data)
+    if written != len(results):
+        raise UnsupportedFormula("Could not write back every formula result")
+    return output
+
+
+def recalculate(filename) -> dict:
+    """Evaluate every formula in `filename` and store the cached values in place.
+
+    Raises UnsupportedFormula, leaving the file untouched, when the workbook
+    needs anything outside the supported subset.
+    """
+    workbook = Workbook(filename)
+    results = Evaluator(workbook).run()
+
+    by_sheet = defaultdict(dict)
+    for (sheet, row, col), value in results.items():
+        by_sheet[sheet][(row, col)] = value
+    parts = {part: by_sheet[name] for name, part in workbook.sheets if by_sheet[name]}
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(prefix=".recalc-", suffix=".xlsx", dir=directory)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(filename) as zin, zipfile.ZipFile(tmp, "w") as zout:
+            for info in zin.infolist():
+                data = zin.read(info)
+                if info.filename in parts:
+                    data = _write_sheet(data, parts[info.filename])
+                zout.writestr(info, data)
+        os.chmod(tmp, os.stat(filename).st_mode & 0o7777)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    return {"formulas": len(results)}
@@ -0,0 +1,185 @@
+"""
+Dependency analysis of workbook formulas for recalc.py reports.
+
+Builds the formula dependency graph with formula_engine and reports the
+structures that make workbooks slow to open and recalculate: circular
+references, the longest dependency chains and the most referenced ranges
+(whole-column references in particular).  Range references go through the
+graph's Span nodes, so growing and whole-column ranges stay cheap; a graph
+too large even so is cut short and the report marked as truncated.
+"""
+
+from collections import Counter, defaultdict, deque
+
+from formula_engine import (
+    MAX_COL,
+    MAX_ROW,
+    Span,
+    Workbook,
+    column_letters,
+    formula_refs,
+)
+
+
+def analyze_dependencies(filename, top: int = 10) -> dict:
+    workbook = Workbook(filename, strict=False)
+    graph = workbook.dependencies()
+
+    components = [
+        component
+        for component in _strongly_connected(graph)
+        if len(component) > 1 or component[0] in graph.get(component[0], ())
+    ]
+    cyclic = {node for component in components for node in component}
+    cycles = [_cells(component) for component in components]
+    cycles.sort(key=len, reverse=True)
+
+    references = Counter()
+    for (sheet, _, _), node in workbook.formulas.items():
+        for ref in formula_refs(node):
+            if not ref.is_cell:
+                references[(ref.sheet or sheet, ref.r1, ref.c1, ref.r2, ref.c2)] += 1
+
+    return {
+        "formula_cells": len(_cells(graph)),
+        "dependency_edges": sum(len(precedents) for precedents in graph.values()),
+        "unparsed_formulas": workbook.unparsed,
+        "truncated": workbook.truncated,
+        "circular_references": [
+            {
+                "cells": len(component),
+                "locations": [_cell_name(cell) for cell in sorted(component)[:top]],
+            }
+            for component in cycles[:top]
+        ],
+        "longest_chains": _longest_chains(graph, cyclic, top),
+        "whole_column_references": sum(
+            count for key, count in references.items() if key[1] is None
+        ),
+        "most_referenced_ranges": [
+            {
+                "range": _range_name(key),
+                "references": count,
+                "cells": _area(key),
+                "whole_column": key[1] is None,
+            }
+            for key, count in references.most_common(top)
+        ],
+    }
+
+
+def _strongly_connected(graph) -> list[list]:
+    """Tarjan's algorithm, iterative so long chains don't hit the recursion limit."""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+
+        while work:
+            node, precedents = work[-1]
+            for precedent in precedents:
+                if precedent not in index:
+                    index[precedent] = low[precedent] = len(index)
+                    stack.append(precedent)
+                    on_stack.add(precedent)
+                    work.append((precedent, iter(graph.get(precedent, ()))))
+                    break
+                if precedent in on_stack:
+                    low[node] = min(low[node], index[precedent])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        cell = stack.pop()
+                        on_stack.discard(cell)
+                        component.append(cell)
+                        if cell == node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def _longest_chains(graph, cyclic, top) -> list[dict]:
+    """Longest acyclic chains of formula cells; Span nodes add no length."""
+    dependents = defaultdict(list)
+    pending = {}
+    for node, precedents in graph.items():
+        if node in cyclic:
+            continue
+        acyclic = [p for p in precedents if p in graph and p not in cyclic]
+        pending[node] = len(acyclic)
+        for precedent in acyclic:
+            dependents[precedent].append(node)
+
+    depth = {}
+    previous = {}
+    ready = deque(node for node, count in pending.items() if count == 0)
+    for node in ready:
+        depth[node] = 0 if isinstance(node, Span) else 1
+    while ready:
+        node = ready.popleft()
+        for dependent in dependents[node]:
+            length = depth[node] + (not isinstance(dependent, Span))
+            if length > depth.get(dependent, -1):
+                depth[dependent] = length
+                previous[dependent] = node
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+
+    chains = []
+    for end in sorted(_cells(depth), key=depth.get, reverse=True)[:top]:
+        if depth[end] < 2:
+            break
+        path = [end]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        path = _cells(reversed(path))
+        chains.append(
+            {
+                "length": depth[end],
+                "start": _cell_name(path[0]),
+                "end": _cell_name(end),
+                "path": [_cell_name(cell) for cell in path[:top]],
+            }
+        )
+    return chains
+
+
+def _cells(nodes) -> list:
+    return [node for node in nodes if not isinstance(node, Span)]
+
+
+def _cell_name(cell) -> str:
+    sheet, row, col = cell
+    return f"{sheet}!{column_letters(col)}{row}"
+
+
+def _range_name(key) -> str:
+    sheet, r1, c1, r2, c2 = key
+    if r1 is None:
+        return f"{sheet}!{column_letters(c1)}:{column_letters(c2)}"
+    if c1 is None:
+        return f"{sheet}!{r1}:{r2}"
+    return f"{sheet}!{column_letters(c1)}{r1}:{column_letters(c2)}{r2}"
+
+
+def _area(key) -> int:
+    _, r1, c1, r2, c2 = key
+    rows = MAX_ROW if r1 is None else r2 - r1 + 1
+    cols = MAX_COL if c1 is None else c2 - c1 + 1
+    return rows * cols
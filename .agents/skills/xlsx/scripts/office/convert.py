@@ -0,0 +1,269 @@
+"""
+Bulk document conversion with LibreOffice (soffice --convert-to).
+
+Starting soffice costs seconds, so converting files one invocation at a
+time is dominated by startup.  convert() groups requests by target format
+and converts each group in batches, one soffice run per batch, with a few
+batches in flight at once.  A result is reported for every input file.
+
+Usage (from the scripts directory):
+    python -m office.convert --to pdf reports/*.xlsx --outdir out/
+    python -m office.convert --to csv data.xlsx
+
+    from office.convert import convert
+
+    for result in convert([("a.xlsx", "pdf"), ("b.docx", "pdf")], outdir="out"):
+        print(result["input"], result["status"])
+
+The target format is anything soffice accepts after --convert-to, e.g.
+"pdf", "csv" or 'csv:Text - txt - csv (StarCalc):59,34,76,1'.
+"""
+
+import argparse
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from office.soffice import run_soffice
+from office.soffice_profile import prepare_profile, profile_slot, user_installation
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_TIMEOUT = 60
+
+
+def convert(
+    requests,
+    outdir=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int | None = None,
+    timeout: float = DEFAULT_TIMEOUT,
+):
+    """Convert (input, target_format) pairs, yielding one result per input.
+
+    Results are yielded as their batch finishes.  Outputs are written to
+    `outdir`, or next to each input when it is None.  `timeout` applies per
+    file, so a batch of n files may take up to n * timeout seconds.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    batches = queue.Queue(maxsize=workers * 2)
+    results = queue.Queue()
+    written = _Claims()
+
+    def produce():
+        try:
+            for batch in _batches(requests, batch_size):
+                batches.put(batch)
+        finally:
+            for _ in range(workers):
+                batches.put(None)
+
+    def consume():
+        try:
+            while (batch := batches.get()) is not None:
+                target, sources = batch
+                reported = set()
+                try:
+                    for result in _convert_batch(batch, outdir, timeout, written):
+                        reported.add(result["input"])
+                        results.put(result)
+                except Exception as e:
+                    # Still report every input, then go on with the next batch.
+                    for source in sources:
+                        if str(source) not in reported:
+                            results.put(
+                                _result(source, target, None, f"Conversion failed: {e}")
+                            )
+        finally:
+            results.put(None)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=consume, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    running = workers
+    while running:
+        result = results.get()
+        if result is None:
+            running -= 1
+        else:
+            yield result
+
+
+def _batches(requests, batch_size):
+    """Group requests by target format into batches of unique file stems.
+
+    soffice names each output after its input's stem, so two inputs with
+    the same stem in one batch would overwrite each other's output.
+    """
+    pending = {}
+    for source, target in requests:
+        batch = pending.setdefault(target, [])
+        if len(batch) >= batch_size or any(
+            Path(source).stem == Path(other).stem for other in batch
+        ):
+            yield target, batch
+            batch = pending[target] = []
+        batch.append(source)
+
+    for target, batch in pending.items():
+        if batch:
+            yield target, batch
+
+
+class _Claims:
+    """Output paths already written by this run, shared across workers."""
+
+    def __init__(self):
+        self._paths = set()
+        self._lock = threading.Lock()
+
+    def claim(self, path: Path) -> bool:
+        with self._lock:
+            if path in self._paths:
+                return False
+            self._paths.add(path)
+            return True
+
+
+def _convert_batch(batch, outdir, timeout, written):
+    """Convert one batch, yielding a result per input as it is known."""
+    target, sources = batch
+
+    missing = [s for s in sources if not Path(s).is_file()]
+    for source in missing:
+        yield _result(source, target, None, "File does not exist")
+    sources = [s for s in sources if s not in missing]
+    if not sources:
+        return
+
+    staging = Path(tempfile.mkdtemp(prefix="convert-"))
+    start = time.perf_counter()
+    try:
+        error = None
+        try:
+            with profile_slot(prepare_profile({})) as slot:
+                result = run_soffice(
+                    [
+                        user_installation(slot),
+                        "--headless",
+                        "--norestore",
+                        "--convert-to",
+                        target,
+                        "--outdir",
+                        str(staging),
+                        *(str(Path(s).absolute()) for s in sources),
+                    ],
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout * len(sources),
+                )
+            if result.returncode != 0:
+                error = result.stderr.strip() or f"exit status {result.returncode}"
+        except subprocess.TimeoutExpired:
+            error = f"Conversion timed out after {timeout * len(sources)} seconds"
+        except (OSError, subprocess.SubprocessError) as e:
+            error = str(e)
+        elapsed = round(time.perf_counter() - start, 3)
+
+        for source in sources:
+            try:
+                result = _collect_output(
+                    source, target, staging, outdir, written, error, elapsed
+                )
+            except Exception as e:
+                result = _result(source, target, None, f"Conversion failed: {e}")
+            yield result
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _collect_output(source, target, staging, outdir, written, error, elapsed):
+    """Move one converted file from the batch's staging directory into place."""
+    extension = target.split(":", 1)[0]
+    converted = staging / f"{Path(source).stem}.{extension}"
+    if not converted.exists():
+        return _result(source, target, None, error or "No output produced")
+    destination = Path(outdir) if outdir else Path(source).parent
+    output = (destination / converted.name).absolute()
+    if not written.claim(output):
+        return _result(source, target, None, f"{output} written by another input")
+    try:
+        destination.mkdir(parents=True, exist_ok=True)
+        shutil.move(converted, output)
+    except OSError as e:
+        return _result(source, target, None, str(e))
+    return _result(source, target, output, None, elapsed)
+
+
+def _result(source, target, output, error, batch_seconds=None):
+    result = {
+        "input": str(source),
+        "format": target,
+        "status": "failed" if error else "converted",
+    }
+    if output is not None:
+        result["output"] = str(output)
+    if error:
+        result["error"] = error
+    if batch_seconds is not None:
+        result["batch_seconds"] = batch_seconds
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert many documents with one soffice run per batch"
+    )
+    parser.add_argument("inputs", nargs="+", help="Files to convert")
+    parser.add_argument(
+        "--to",
+        required=True,
+        help="Target format passed to soffice --convert-to (e.g. pdf, csv)",
+    )
+    parser.add_argument(
+        "--outdir", help="Output directory (default: next to each input)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Files per soffice run (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Concurrent soffice runs (default: CPU count)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Seconds allowed per file (default: {DEFAULT_TIMEOUT})",
+    )
+    args = parser.parse_args()
+
+    failed = 0
+    for result in convert(
+        [(source, args.to) for source in args.inputs],
+        outdir=args.outdir,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        timeout=args.timeout,
+    ):
+        failed += result["status"] == "failed"
+        print(json.dumps(result), flush=True)
+
+    print(
+        json.dumps({"summary": {"files": len(args.inputs), "failed": failed}}),
+        flush=True,
+    )
+    sys.exit(1 if failed else 0)
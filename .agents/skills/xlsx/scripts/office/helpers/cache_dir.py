@@ -0,0 +1,12 @@
+"""Where the pack, recalc and soffice profile caches live on disk."""
+
+import os
+from pathlib import Path
+
+
+def cache_dir(variable: str, name: str) -> Path:
+    """$`variable` if set, otherwise `name` under $XDG_CACHE_HOME or ~/.cache."""
+    if variable in os.environ:
+        return Path(os.environ[variable]).expanduser()
+    base = os.environ.get("XDG_CACHE_HOME", "~/.cache")
+    return Path(base).expanduser() / name
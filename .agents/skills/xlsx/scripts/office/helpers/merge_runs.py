@@ -21,17 +21,7 @@ def merge_runs(input_dir: str) -> tuple[int, str]:
 
     try:
         dom = defusedxml.minidom.parseString(doc_xml.read_text(encoding="utf-8"))
-        root = dom.documentElement
-
-        _remove_elements(root, "proofErr")
-        _strip_run_rsid_attrs(root)
-
-        containers = {run.parentNode for run in _find_elements(root, "r")}
-
-        merge_count = 0
-        for container in containers:
-            merge_count += _merge_runs_in(container)
-
+        merge_count = merge_runs_in_dom(dom)
         doc_xml.write_bytes(dom.toxml(encoding="UTF-8"))
         return merge_count, f"Merged {merge_count} runs"
 
@@ -39,6 +29,20 @@ def merge_runs(input_dir: str) -> tuple[int, str]:
         return 0, f"Error: {e}"
 
 
+def merge_runs_in_dom(dom) -> int:
+    """Merge runs in a parsed document.xml in place; returns the merge count."""
+    root = dom.documentElement
+
+    _remove_elements(root, "proofErr")
+    _strip_run_rsid_attrs(root)
+
+    containers = {run.parentNode for run in _find_elements(root, "r")}
+
+    merge_count = 0
+    for container in containers:
+        merge_count += _merge_runs_in(container)
+    return merge_count
+
 
 
 def _find_elements(root, tag: str) -> list:
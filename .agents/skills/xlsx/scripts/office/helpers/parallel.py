@@ -0,0 +1,21 @@
+"""Sizing the worker pools pack.py and unpack.py format XML parts in."""
+
+import os
+
+XML_SUFFIXES = (".xml", ".rels")
+
+# Below this much XML, starting worker processes costs more than it saves.
+PARALLEL_MIN_BYTES = 1024 * 1024
+
+
+def pool_size(workers: int | None, sizes: dict) -> int:
+    """Processes to format parts of these sizes in, or 0 to stay in-process."""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sizes)))
+    if workers > 1 and sum(sizes.values()) >= PARALLEL_MIN_BYTES:
+        return workers
+    return 0
+
+
+def largest_first(sizes: dict) -> list:
+    """Parts by decreasing size, so the largest don't finish last."""
+    return sorted(sizes, key=sizes.get, reverse=True)
@@ -0,0 +1,234 @@
+"""Condense and pretty-print OOXML parts without building a DOM.
+
+pack.py condenses parts (drops whitespace-only text and comments outside
+<*:t> elements) and unpack.py pretty-prints them.  Both used to build a
+minidom tree, which is slow and takes many times the part's size in memory
+on large sheet1.xml or document.xml parts.  Here the part is streamed
+through a SAX parser and written out directly, producing byte-for-byte the
+same output as minidom's toxml()/toprettyxml().
+
+The minidom implementations are kept as condense_xml_minidom() and
+pretty_print_xml_minidom(): they serve as the reference for parity checks
+and as the fallback for documents with a DOCTYPE, which the streaming
+writer does not reproduce.
+"""
+
+import io
+import xml.sax.handler
+
+import defusedxml.minidom
+import defusedxml.sax
+
+
+def condense_xml(data: bytes | str) -> bytes:
+    """Drop whitespace-only text and comments, except inside <*:t> elements."""
+    try:
+        return _format(data, indent="", newl="", encoding="UTF-8", condense=True)
+    except _NeedsDom:
+        return condense_xml_minidom(data)
+
+
+def pretty_print_xml(data: bytes | str) -> bytes:
+    try:
+        return _format(
+            data, indent="  ", newl="\n", encoding="utf-8", condense=False
+        )
+    except _NeedsDom:
+        return pretty_print_xml_minidom(data)
+
+
+def condense_xml_minidom(data: bytes | str) -> bytes:
+    dom = defusedxml.minidom.parseString(data)
+
+    for element in dom.getElementsByTagName("*"):
+        if element.tagName.endswith(":t"):
+            continue
+
+        for child in list(element.childNodes):
+            if (
+                child.nodeType == child.TEXT_NODE
+                and child.nodeValue
+                and child.nodeValue.strip() == ""
+            ) or child.nodeType == child.COMMENT_NODE:
+                element.removeChild(child)
+
+    return dom.toxml(encoding="UTF-8")
+
+
+def pretty_print_xml_minidom(data: bytes | str) -> bytes:
+    dom = defusedxml.minidom.parseString(data)
+    return dom.toprettyxml(indent="  ", encoding="utf-8")
+
+
+class _NeedsDom(Exception):
+    pass
+
+
+def _format(data, indent, newl, encoding, condense) -> bytes:
+    writer = _Writer(indent, newl, condense)
+    writer.out.append(f'<?xml version="1.0" encoding="{encoding}"?>{newl}')
+
+    parser = defusedxml.sax.make_parser()
+    parser.setContentHandler(writer)
+    parser.setProperty(xml.sax.handler.property_lexical_handler, writer)
+    parser.parse(io.BytesIO(data.encode() if isinstance(data, str) else data))
+
+    return "".join(writer.out).encode("utf-8", "xmlcharrefreplace")
+
+
+class _Element:
+    __slots__ = ("tag", "keep_whitespace", "held", "has_children", "expanded")
+
+    def __init__(self, tag: str, keep_whitespace: bool):
+        self.tag = tag
+        self.keep_whitespace = keep_whitespace
+        # A first text/CDATA child, written inline if it stays the only one.
+        self.held = None
+        self.has_children = False
+        # Start tag closed, children written on their own lines.
+        self.expanded = False
+
+
+class _Writer(xml.sax.handler.ContentHandler, xml.sax.handler.LexicalHandler):
+    """Writes SAX events the way minidom's Node.writexml() writes the tree.
+
+    An element's start tag is written as soon as it opens.  A first text or
+    CDATA child is held back, because a lone text child is written inline
+    while anything more puts each child on its own indented line.
+    """
+
+    def __init__(self, indent: str, newl: str, condense: bool):
+        super().__init__()
+        self.indent = indent
+        self.newl = newl
+        self.condense = condense
+        self.out: list[str] = []
+        self.stack: list[_Element] = []
+        self.text: list[str] = []
+        self.cdata = False
+        # Prefixes in scope, one set per open element.  The parser runs
+        # without namespace processing (which would lose the prefixes), so
+        # unbound prefixes are rejected here, as minidom rejects them.
+        self.prefixes: list[set[str]] = [{"xml", "xmlns"}]
+
+    def startElement(self, name, attrs):
+        self._flush_text()
+        self._open_child()
+
+        names = attrs.getNames()
+        declarations = [n for n in names if n == "xmlns" or n.startswith("xmlns:")]
+        prefixes = self.prefixes[-1]
+        if declarations:
+            prefixes = prefixes | {n[6:] for n in declarations if n != "xmlns"}
+        for qname in [name, *names]:
+            prefix = qname.partition(":")[0] if ":" in qname else None
+            if prefix is not None and prefix not in prefixes:
+                raise ValueError(f"unbound prefix: {qname}")
+        self.prefixes.append(prefixes)
+
+        # minidom lists namespace declarations before the other attributes.
+        self.out.append(self._current_indent() + "<" + name)
+        for attr in declarations + [n for n in names if n not in declarations]:
+            self.out.append(f' {attr}="{_escape(attrs[attr])}"')
+
+        keep = not self.condense or name.endswith(":t")
+        self.stack.append(_Element(name, keep))
+
+    def endElement(self, name):
+        self._flush_text()
+        element = self.stack.pop()
+        self.prefixes.pop()
+        if element.expanded:
+            self.out.append(f"{self._current_indent()}</{element.tag}>{self.newl}")
+        elif element.held is not None:
+            held = self._inline(element.held)
+            self.out.append(f">{held}</{element.tag}>{self.newl}")
+        else:
+            self.out.append("/>" + self.newl)
+
+    def characters(self, content):
+        self.text.append(content)
+
+    def processingInstruction(self, target, data):
+        self._flush_text()
+        self._node(("pi", f"{target} {data}"))
+
+    def comment(self, content):
+        self._flush_text()
+        if self.stack and not self.stack[-1].keep_whitespace:
+            return
+        self._node(("comment", content))
+
+    def startCDATA(self):
+        self._flush_text()
+        self.cdata = True
+
+    def endCDATA(self):
+        # Like minidom, an empty section leaves no node behind.
+        if self.text:
+            self._node(("cdata", "".join(self.text)))
+        self.text = []
+        self.cdata = False
+
+    def startDTD(self, name, public_id, system_id):
+        raise _NeedsDom()
+
+    def _flush_text(self):
+        if not self.text or self.cdata:
+            return
+        data = "".join(self.text)
+        self.text = []
+        if self.stack and not self.stack[-1].keep_whitespace and not data.strip():
+            return
+        self._node(("text", data))
+
+    def _node(self, node):
+        """Write a complete child node of the innermost open element."""
+        if self.stack:
+            element = self.stack[-1]
+            if not element.has_children and node[0] in ("text", "cdata"):
+                element.has_children = True
+                element.held = node
+                return
+        self._open_child()
+        self.out.append(self._block(node))
+
+    def _open_child(self):
+        """Prepare the innermost open element for a child on its own line."""
+        if not self.stack:
+            return
+        element = self.stack[-1]
+        element.has_children = True
+        if not element.expanded:
+            element.expanded = True
+            self.out.append(">" + self.newl)
+            if element.held is not None:
+                self.out.append(self._block(element.held))
+                element.held = None
+
+    def _current_indent(self) -> str:
+        return self.indent * len(self.stack)
+
+    def _block(self, node) -> str:
+        kind, data = node
+        indent = self._current_indent()
+        if kind == "text":
+            return _escape(f"{indent}{data}{self.newl}")
+        if kind == "cdata":
+            return f"<![CDATA[{data}]]>"
+        if kind == "comment":
+            return f"{indent}<!--{data}-->{self.newl}"
+        return f"{indent}<?{data}?>{self.newl}"
+
+    def _inline(self, node) -> str:
+        kind, data = node
+        return _escape(data) if kind == "text" else f"<![CDATA[{data}]]>"
+
+
+def _escape(data: str) -> str:
+    return (
+        data.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
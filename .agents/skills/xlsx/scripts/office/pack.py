@@ -8,25 +8,50 @@ Usage:
 Examples:
     python pack.py unpacked/ output.docx --original input.docx
     python pack.py unpacked/ output.pptx --validate false
+    python pack.py unpacked/ output.xlsx --original input.xlsx --reuse-original true
+    python pack.py unpacked/ output.xlsx --deterministic true
 """
 
 import argparse
+import hashlib
+import os
+import struct
 import sys
-import shutil
-import tempfile
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
 from pathlib import Path
 
-import defusedxml.minidom
-
+from helpers.parallel import XML_SUFFIXES, largest_first, pool_size
+from helpers.xml_format import condense_xml
+from pack_cache import PartDigestCache, ValidationCache
+from unpack import SKIPPED_PARTS_FILE, read_skipped_parts
 from validators import DOCXSchemaValidator, PPTXSchemaValidator, RedliningValidator
 
+# Formats that are already compressed; deflating them again costs CPU for
+# next to no size reduction, so they are stored as-is.
+PRECOMPRESSED_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".wdp", ".emz", ".wmz",
+    ".mp3", ".m4a", ".mp4", ".m4v", ".mov", ".wmv",
+    ".zip", ".docx", ".xlsx", ".pptx", ".xlsm", ".docm", ".pptm",
+}
+
+# Entry metadata used in deterministic mode; 1980-01-01 is the earliest
+# timestamp a zip entry can hold.
+DETERMINISTIC_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+DETERMINISTIC_MODE = 0o100644
+
+
 def pack(
     input_directory: str,
     output_file: str,
     original_file: str | None = None,
     validate: bool = True,
     infer_author_func=None,
+    workers: int | None = None,
+    compress_level: int | None = None,
+    reuse_original: bool = False,
+    deterministic: bool = False,
 ) -> tuple[None, str]:
     input_dir = Path(input_directory)
     output_path = Path(output_file)
@@ -38,9 +63,25 @@ def pack(
     if suffix not in {".docx", ".pptx", ".xlsx"}:
         return None, f"Error: {output_file} must be a .docx, .pptx, or .xlsx file"
 
+    # Parts unpack.py left in the archive are copied back from --original,
+    # or from the file that was unpacked if --original lacks them.  A part
+    # written to disk after unpacking takes precedence.
+    skipped_source, skipped = read_skipped_parts(input_dir)
+    skipped = [name for name in skipped if not (input_dir / name).is_file()]
+    source_file = original_file or skipped_source
+    skipped_from, error = _skipped_sources(
+        input_dir, skipped, [original_file, skipped_source]
+    )
+    if error:
+        return None, error
+
     if validate and original_file:
         original_path = Path(original_file)
         if original_path.exists():
+            if skipped and suffix in {".docx", ".pptx"}:
+                # The validators check the tree as a whole.
+                _extract_skipped(input_dir, skipped_from)
+                skipped = []
             success, output = _run_validation(
                 input_dir, original_path, suffix, infer_author_func
             )
@@ -49,19 +90,87 @@ def pack(
             if not success:
                 return None, f"Error: Validation failed for {input_dir}"
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_content_dir = Path(temp_dir) / "content"
-        shutil.copytree(input_dir, temp_content_dir)
-
-        for pattern in ["*.xml", "*.rels"]:
-            for xml_file in temp_content_dir.rglob(pattern):
-                _condense_xml(xml_file)
+    manifest = input_dir / SKIPPED_PARTS_FILE
+    files = [f for f in input_dir.rglob("*") if f.is_file() and f != manifest]
+    arcnames = {f: f.relative_to(input_dir).as_posix() for f in files}
+    entries = [(name, None) for name in skipped] + [(arcnames[f], f) for f in files]
+    if deterministic:
+        entries.sort(key=lambda entry: _entry_order(entry[0]))
+
+    with ExitStack() as stack:
+        archives = {
+            path: stack.enter_context(zipfile.ZipFile(path))
+            for path in {skipped_from[name] for name in skipped}
+        }
+        reuse = None
+        if reuse_original and source_file and Path(source_file).exists():
+            original = archives.get(source_file) or stack.enter_context(
+                zipfile.ZipFile(source_file)
+            )
+            reuse = _Reuse(original, source_file, input_dir)
+        # Parts whose cached digests show them unchanged are never condensed.
+        reused = {}
+        if reuse is not None:
+            for f in files:
+                info = reuse.cached_match(arcnames[f], f)
+                if info is not None:
+                    reused[f] = info
+
+        xml_sizes = {
+            f: f.stat().st_size
+            for f in files
+            if f.name.endswith(XML_SUFFIXES) and f not in reused
+        }
+        workers = pool_size(workers, xml_sizes)
 
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for f in temp_content_dir.rglob("*"):
-                if f.is_file():
-                    zf.write(f, f.relative_to(temp_content_dir))
+        with ProcessPoolExecutor(workers) if workers else nullcontext() as executor:
+            # Results are still written in directory order below.
+            futures = {}
+            if executor is not None:
+                for f in largest_first(xml_sizes):
+                    futures[f] = executor.submit(_condense_xml, f)
+                if reuse is not None:
+                    reuse.submit(executor, [arcnames[f] for f in xml_sizes])
+
+            with zipfile.ZipFile(
+                output_path, "w", zipfile.ZIP_DEFLATED, compresslevel=compress_level
+            ) as zf:
+                for arcname, f in entries:
+                    if f is None:
+                        archive = archives[skipped_from[arcname]]
+                        info = archive.getinfo(arcname)
+                        _copy_compressed(archive, info, zf, deterministic)
+                        continue
+                    if f in reused:
+                        _copy_compressed(reuse.original, reused[f], zf, deterministic)
+                        continue
+
+                    data = None
+                    if f in xml_sizes:
+                        data = futures[f].result() if futures else _condense_xml(f)
+
+                    # Parts equal to the original keep its compressed bytes.
+                    unchanged = reuse.match(arcname, f, data) if reuse else None
+                    if unchanged is not None:
+                        _copy_compressed(reuse.original, unchanged, zf, deterministic)
+                    elif deterministic:
+                        _write_deterministic(zf, arcname, f, data, compress_level)
+                    elif data is not None:
+                        info = zipfile.ZipInfo.from_file(f, arcname)
+                        zf.writestr(
+                            info,
+                            data,
+                            zipfile.ZIP_DEFLATED,
+                            compresslevel=compress_level,
+                        )
+                    elif f.suffix.lower() in PRECOMPRESSED_SUFFIXES:
+                        zf.write(f, arcname, zipfile.ZIP_STORED)
+                    else:
+                        zf.write(f, arcname)
+
+        if reuse is not None:
+            reuse.cache.save()
 
     return None, f"Successfully packed {input_dir} to {output_file}"
 
@@ -74,6 +183,7 @@ def _run_validation(
 ) -> tuple[bool, str | None]:
     output_lines = []
     validators = []
+    verdicts = ValidationCache(unpacked_dir)
 
     if suffix == ".docx":
         author = "Claude"
@@ -84,11 +194,15 @@ def _run_validation(
                 print(f"Warning: {e} Using default author 'Claude'.", file=sys.stderr)
 
         validators = [
-            DOCXSchemaValidator(unpacked_dir, original_file),
-            RedliningValidator(unpacked_dir, original_file, author=author),
+            DOCXSchemaValidator(unpacked_dir, original_file, verdicts=verdicts),
+            RedliningValidator(
+                unpacked_dir, original_file, author=author, verdicts=verdicts
+            ),
         ]
     elif suffix == ".pptx":
-        validators = [PPTXSchemaValidator(unpacked_dir, original_file)]
+        validators = [
+            PPTXSchemaValidator(unpacked_dir, original_file, verdicts=verdicts)
+        ]
 
     if not validators:
         return True, None
@@ -98,6 +212,7 @@ def _run_validation(
         output_lines.append(f"Auto-repaired {total_repairs} issue(s)")
 
     success = all(v.validate() for v in validators)
+    verdicts.save()
 
     if success:
         output_lines.append("All validations PASSED!")
@@ -105,24 +220,205 @@ def _run_validation(
     return success, "\n".join(output_lines) if output_lines else None
 
 
-def _condense_xml(xml_file: Path) -> None:
+class _Reuse:
+    """Finds unpacked parts whose content is unchanged from the original.
+
+    Parts are compared by the SHA-256 of their condensed bytes, so a part
+    that was only pretty-printed by unpack.py still matches.  Digests are
+    kept in a PartDigestCache, which lets later packs skip condensing
+    unchanged parts altogether.
+    """
+
+    def __init__(self, original: zipfile.ZipFile, original_file, input_dir: Path):
+        self.original = original
+        self.original_file = original_file
+        self.cache = PartDigestCache(input_dir, original_file)
+        self.futures = {}
+
+    def entry(self, arcname: str) -> zipfile.ZipInfo | None:
+        try:
+            info = self.original.getinfo(arcname)
+        except KeyError:
+            return None
+        return None if info.flag_bits & 0x1 else info  # encrypted
+
+    def cached_match(self, arcname: str, path: Path) -> zipfile.ZipInfo | None:
+        info = self.entry(arcname)
+        if info is None:
+            return None
+        digest = self.cache.part_digest(arcname, path.stat())
+        if digest is not None and digest == self.cache.original_digest(arcname):
+            return info
+        return None
+
+    def submit(self, executor, arcnames) -> None:
+        """Digest the original's parts in `executor` ahead of match()."""
+        for arcname in arcnames:
+            if self.entry(arcname) and not self.cache.original_digest(arcname):
+                self.futures[arcname] = executor.submit(
+                    _entry_digest, self.original_file, arcname
+                )
+
+    def match(
+        self, arcname: str, path: Path, data: bytes | None
+    ) -> zipfile.ZipInfo | None:
+        stat = path.stat()
+        digest = _part_digest(path, data)
+        self.cache.set_part_digest(arcname, stat, digest)
+
+        info = self.entry(arcname)
+        if info is None:
+            return None
+        original_digest = self.cache.original_digest(arcname)
+        if original_digest is None:
+            future = self.futures.pop(arcname, None)
+            if future is not None:
+                original_digest = future.result()
+            else:
+                original_digest = _entry_digest(self.original_file, arcname)
+            self.cache.set_original_digest(arcname, original_digest)
+        return info if digest == original_digest else None
+
+
+def _part_digest(path: Path, data: bytes | None) -> str:
+    if data is not None:
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry_digest(original_file, arcname: str) -> str | None:
+    """Digest of an original part as pack would write it, None if unreadable."""
+    try:
+        with zipfile.ZipFile(original_file) as original:
+            if not arcname.endswith(XML_SUFFIXES):
+                digest = hashlib.sha256()
+                with original.open(arcname) as f:
+                    while chunk := f.read(1024 * 1024):
+                        digest.update(chunk)
+                return digest.hexdigest()
+            return hashlib.sha256(condense_xml(original.read(arcname))).hexdigest()
+    except Exception:
+        return None
+
+
+def _skipped_sources(
+    input_dir: Path, skipped: list[str], candidates
+) -> tuple[dict[str, str], str | None]:
+    """Pick the first of `candidates` that has each skipped part.
+
+    Checked before the output is opened, so a part missing from every
+    candidate is an error instead of a truncated archive.
+    """
+    members = {}
+    for candidate in dict.fromkeys(filter(None, candidates)):
+        try:
+            with zipfile.ZipFile(candidate) as zf:
+                members[candidate] = set(zf.namelist())
+        except (OSError, zipfile.BadZipFile):
+            continue
+
+    sources = {}
+    for name in skipped:
+        source = next((c for c, names in members.items() if name in names), None)
+        if source is None:
+            return {}, (
+                f"Error: {input_dir} is missing {name}; "
+                "pass an --original file that has it"
+            )
+        sources[name] = source
+    return sources, None
+
+
+def _extract_skipped(input_dir: Path, skipped_from: dict[str, str]) -> None:
+    for source in set(skipped_from.values()):
+        with zipfile.ZipFile(source) as zf:
+            members = [name for name, s in skipped_from.items() if s == source]
+            zf.extractall(input_dir, members=members)
+    (input_dir / SKIPPED_PARTS_FILE).unlink()
+
+
+def _entry_order(arcname: str) -> tuple[bool, str]:
+    # [Content_Types].xml first, as Office itself writes it, then by name.
+    return arcname != "[Content_Types].xml", arcname
+
+
+def _deterministic_info(arcname: str) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(arcname, DETERMINISTIC_DATE_TIME)
+    info.create_system = 3  # Unix, whatever platform packs the file
+    info.external_attr = DETERMINISTIC_MODE << 16
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def _write_deterministic(
+    zf: zipfile.ZipFile,
+    arcname: str,
+    path: Path,
+    data: bytes | None,
+    compress_level: int | None,
+) -> None:
+    """Write a part with fixed metadata, so equal inputs give equal bytes."""
+    info = _deterministic_info(arcname)
+    if data is None:
+        data = path.read_bytes()
+        if path.suffix.lower() in PRECOMPRESSED_SUFFIXES:
+            info.compress_type = zipfile.ZIP_STORED
+    zf.writestr(info, data, compresslevel=compress_level)
+
+
+def _copy_compressed(
+    source: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    dest: zipfile.ZipFile,
+    deterministic: bool = False,
+) -> None:
+    """Append `info`'s entry from `source` to `dest` without recompressing it.
+
+    zipfile has no public API for this, so the local header is rebuilt with
+    ZipInfo.FileHeader() and the compressed bytes are copied verbatim.
+    """
+    source.fp.seek(info.header_offset)
+    header = struct.unpack(
+        zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader)
+    )
+    source.fp.seek(header[-2] + header[-1], os.SEEK_CUR)  # name, extra field
+
+    if deterministic:
+        copied = _deterministic_info(info.filename)
+    else:
+        copied = zipfile.ZipInfo(info.filename, info.date_time)
+        copied.create_system = info.create_system
+        copied.external_attr = info.external_attr
+    copied.compress_type = info.compress_type
+    copied.flag_bits = info.flag_bits & ~0x08  # sizes go in the local header
+    copied.CRC = info.CRC
+    copied.compress_size = info.compress_size
+    copied.file_size = info.file_size
+
+    with dest._lock:
+        dest._writecheck(copied)
+        copied.header_offset = dest.fp.tell()
+        dest.fp.write(copied.FileHeader())
+        remaining = info.compress_size
+        while remaining:
+            chunk = source.fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated entry {info.filename}")
+            dest.fp.write(chunk)
+            remaining -= len(chunk)
+        dest.filelist.append(copied)
+        dest.NameToInfo[copied.filename] = copied
+        dest.start_dir = dest.fp.tell()
+        dest._didModify = True
+
+
+def _condense_xml(xml_file: Path) -> bytes:
     try:
-        with open(xml_file, encoding="utf-8") as f:
-            dom = defusedxml.minidom.parse(f)
-
-        for element in dom.getElementsByTagName("*"):
-            if element.tagName.endswith(":t"):
-                continue
-
-            for child in list(element.childNodes):
-                if (
-                    child.nodeType == child.TEXT_NODE
-                    and child.nodeValue
-                    and child.nodeValue.strip() == ""
-                ) or child.nodeType == child.COMMENT_NODE:
-                    element.removeChild(child)
-
-        xml_file.write_bytes(dom.toxml(encoding="UTF-8"))
+        return condense_xml(xml_file.read_bytes())
     except Exception as e:
         print(f"ERROR: Failed to parse {xml_file.name}: {e}", file=sys.stderr)
         raise
@@ -145,6 +441,37 @@ if __name__ == "__main__":
         metavar="true|false",
         help="Run validation with auto-repair (default: true)",
     )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(10),
+        default=None,
+        metavar="0-9",
+        help="Deflate level for compressed parts (default: zlib default)",
+    )
+    parser.add_argument(
+        "--reuse-original",
+        type=lambda x: x.lower() == "true",
+        default=False,
+        metavar="true|false",
+        help="Copy parts whose condensed content matches --original straight "
+        "from it; digests are cached so later packs skip unchanged parts "
+        "(default: false)",
+    )
+    parser.add_argument(
+        "--deterministic",
+        type=lambda x: x.lower() == "true",
+        default=False,
+        metavar="true|false",
+        help="Sorted entries with fixed timestamps and permissions, so equal "
+        "input gives byte-identical output (default: false)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used to condense XML parts (default: CPU count)",
+    )
     args = parser.parse_args()
 
     _, message = pack(
@@ -152,6 +479,10 @@ if __name__ == "__main__":
         args.output_file,
         original_file=args.original,
         validate=args.validate,
+        workers=args.workers,
+        compress_level=args.compress_level,
+        reuse_original=args.reuse_original,
+        deterministic=args.deterministic,
     )
     print(message)
 
@@ -0,0 +1,135 @@
+"""
+Part digests and validation verdicts remembered between pack.py runs.
+
+Incremental repacking compares each unpacked part with the same part of
+the original document by the SHA-256 of its normalized (condensed) bytes.
+Getting those digests means condensing both sides, so they are cached on
+disk: unpacked parts are keyed by file size, mtime and inode, original
+parts by the original file's size and mtime.
+
+Validation verdicts are kept per part under a key that the validators
+derive from the part's contents, its schema and the validator version, so
+only parts that changed since the last pack are validated again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from helpers.cache_dir import cache_dir
+
+# Bump whenever condensing or the digest format changes.
+CACHE_VERSION = 1
+
+# A file modified this recently could change again without its mtime moving
+# (coarse filesystem timestamps), so its digest is not kept.
+RACY_NS = 2 * 10**9
+
+
+def default_cache_dir() -> Path:
+    return cache_dir("PACK_CACHE_DIR", "office-pack")
+
+
+class PartDigestCache:
+    def __init__(self, input_dir, original_file, directory=None):
+        self.path = _cache_path(directory, "digests", input_dir)
+        self.original_stamp = _stamp(os.stat(original_file))
+        self.parts: dict[str, list] = {}
+        self.original: dict[str, str] = {}
+
+        try:
+            cached = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        if cached.get("version") != CACHE_VERSION:
+            return
+        self.parts = cached["parts"]
+        if cached["original_stamp"] == self.original_stamp:
+            self.original = cached["original"]
+
+    def part_digest(self, arcname: str, stat: os.stat_result) -> str | None:
+        entry = self.parts.get(arcname)
+        if entry is not None and entry[0] == _stamp(stat):
+            return entry[1]
+        return None
+
+    def set_part_digest(
+        self, arcname: str, stat: os.stat_result, digest: str
+    ) -> None:
+        if time.time_ns() - stat.st_mtime_ns < RACY_NS:
+            self.parts.pop(arcname, None)
+        else:
+            self.parts[arcname] = [_stamp(stat), digest]
+
+    def original_digest(self, arcname: str) -> str | None:
+        return self.original.get(arcname)
+
+    def set_original_digest(self, arcname: str, digest: str | None) -> None:
+        if digest is not None:
+            self.original[arcname] = digest
+
+    def save(self) -> None:
+        _write_json(
+            self.path,
+            {
+                "version": CACHE_VERSION,
+                "parts": self.parts,
+                "original_stamp": self.original_stamp,
+                "original": self.original,
+            },
+        )
+
+
+class ValidationCache:
+    """Verdicts for the parts of one unpacked directory, by validator key."""
+
+    def __init__(self, input_dir, directory=None):
+        self.path = _cache_path(directory, "verdicts", input_dir)
+        self.verdicts: dict[str, list] = {}
+
+        try:
+            cached = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        if cached.get("version") == CACHE_VERSION:
+            self.verdicts = cached["verdicts"]
+
+    def get(self, part: str, key: str):
+        entry = self.verdicts.get(part)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        return None
+
+    def put(self, part: str, key: str, verdict) -> None:
+        self.verdicts[part] = [key, verdict]
+
+    def save(self) -> None:
+        _write_json(self.path, {"version": CACHE_VERSION, "verdicts": self.verdicts})
+
+
+def _cache_path(directory, kind: str, input_dir) -> Path:
+    directory = Path(directory) if directory else default_cache_dir()
+    name = hashlib.sha256(str(Path(input_dir).absolute()).encode()).hexdigest()
+    return directory / kind / f"{name}.json"
+
+
+def _write_json(path: Path, value) -> None:
+    data = json.dumps(value)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=path.parent)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        Path(tmp).unlink(missing_ok=True)
+
+
+def _stamp(stat: os.stat_result) -> list[int]:
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
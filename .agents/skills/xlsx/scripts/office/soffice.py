@@ -4,17 +4,24 @@ sockets may be blocked (e.g., sandboxed VMs).  Detects the restriction
 at runtime and applies an LD_PRELOAD shim if needed.
 
 Usage:
-    from office.soffice import run_soffice, get_soffice_env
+    from office.soffice import run_soffice, run_soffice_async, get_soffice_env
 
     # Option 1 – run soffice directly
     result = run_soffice(["--headless", "--convert-to", "pdf", "input.docx"])
 
+    # ... or from a coroutine, without blocking the event loop
+    result = await run_soffice_async(["--headless", ...], timeout=60)
+
     # Option 2 – get env dict for your own subprocess calls
     env = get_soffice_env()
     subprocess.run(["soffice", ...], env=env)
 """
 
+import asyncio
+import functools
+import hashlib
 import os
+import signal
 import socket
 import subprocess
 import tempfile
@@ -37,10 +44,60 @@ def run_soffice(args: list[str], **kwargs) -> subprocess.CompletedProcess:
     return subprocess.run(["soffice"] + args, env=env, **kwargs)
 
 
+async def run_soffice_async(
+    args: list[str], timeout: float | None = None, **kwargs
+) -> subprocess.CompletedProcess:
+    """Asyncio counterpart of run_soffice(); stdout and stderr are captured.
+
+    soffice runs in its own process group, which is killed on timeout
+    (raising subprocess.TimeoutExpired) or when the awaiting task is
+    cancelled, so no stray soffice.bin outlives the call.
+    """
+    kwargs.setdefault("env", get_soffice_env())
+    cmd = ["soffice"] + args
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+        **kwargs,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill_process_group(process)
+        await process.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout) from None
+    except asyncio.CancelledError:
+        _kill_process_group(process)
+        # Reap the child even if the task is cancelled again meanwhile.
+        await asyncio.shield(process.wait())
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _kill_process_group(process) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def soffice_version() -> str:
+    try:
+        result = run_soffice(["--version"], capture_output=True, text=True, timeout=30)
+        return result.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
 
-_SHIM_SO = Path(tempfile.gettempdir()) / "lo_socket_shim.so"
+_SHIM_DIR = Path(tempfile.gettempdir())
+_SHIM_CFLAGS = ["-shared", "-fPIC", "-pthread"]
 
 
+@functools.lru_cache(maxsize=None)
 def _needs_shim() -> bool:
     try:
         s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -50,19 +107,59 @@ def _needs_shim() -> bool:
         return True
 
 
+@functools.lru_cache(maxsize=None)
 def _ensure_shim() -> Path:
-    if _SHIM_SO.exists():
-        return _SHIM_SO
-
-    src = Path(tempfile.gettempdir()) / "lo_socket_shim.c"
-    src.write_text(_SHIM_SOURCE)
-    subprocess.run(
-        ["gcc", "-shared", "-fPIC", "-o", str(_SHIM_SO), str(src), "-ldl"],
-        check=True,
-        capture_output=True,
+    """Build the shim once per source/compiler combination and reuse it.
+
+    The library is named after a hash of the shim source and compiler flags
+    plus a hash of `gcc --version`, so an edited shim or upgraded compiler
+    gets a fresh build.  Without gcc, any library already built from the
+    same source is reused.  It is compiled to a private temporary name and
+    renamed into place, so concurrent builds never expose a half-written
+    library.
+    """
+    source_key = _short_hash(_SHIM_SOURCE, " ".join(_SHIM_CFLAGS))
+    try:
+        compiler_key = _short_hash(_gcc_version())
+    except (OSError, subprocess.SubprocessError):
+        built = sorted(
+            _SHIM_DIR.glob(f"lo_socket_shim-{source_key}-*.so"),
+            key=lambda path: path.stat().st_mtime,
+        )
+        if built:
+            return built[-1]
+        raise
+    shim = _SHIM_DIR / f"lo_socket_shim-{source_key}-{compiler_key}.so"
+    if shim.exists():
+        return shim
+
+    fd, src = tempfile.mkstemp(prefix="lo_socket_shim-", suffix=".c", dir=_SHIM_DIR)
+    with os.fdopen(fd, "w") as f:
+        f.write(_SHIM_SOURCE)
+    tmp = f"{src[:-2]}.so"
+    try:
+        subprocess.run(
+            ["gcc", *_SHIM_CFLAGS, "-o", tmp, src, "-ldl"],
+            check=True,
+            capture_output=True,
+        )
+        os.replace(tmp, shim)
+    finally:
+        os.unlink(src)
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return shim
+
+
+def _short_hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+def _gcc_version() -> str:
+    result = subprocess.run(
+        ["gcc", "--version"], check=True, capture_output=True, text=True
     )
-    src.unlink()
-    return _SHIM_SO
+    return result.stdout.splitlines()[0] if result.stdout else ""
 
 
 
@@ -70,6 +167,7 @@ _SHIM_SOURCE = r"""
 #define _GNU_SOURCE
 #include <dlfcn.h>
 #include <errno.h>
+#include <pthread.h>
 #include <signal.h>
 #include <stdio.h>
 #include <stdlib.h>
@@ -83,13 +181,22 @@ static int (*real_accept)(int, struct sockaddr *, socklen_t *);
 static int (*real_close)(int);
 static int (*real_read)(int, void *, size_t);
 
-/* Per-FD bookkeeping (FDs >= 1024 are passed through unshimmed). */
-static int is_shimmed[1024];
-static int peer_of[1024];
-static int wake_r[1024];            /* accept() blocks reading this */
-static int wake_w[1024];            /* close()  writes to this      */
+/* Per-FD bookkeeping, indexed by FD and grown on demand. */
+struct shim_fd {
+    int shimmed;
+    int peer;
+    int wake_r;                     /* accept() blocks reading this */
+    int wake_w;                     /* close()  writes to this      */
+};
+
+static pthread_mutex_t table_lock = PTHREAD_MUTEX_INITIALIZER;
+static struct shim_fd *table;       /* guarded by table_lock        */
+static size_t table_size;
 static int listener_fd = -1;        /* FD that received listen()    */
 
+static void lock_table(void)   { pthread_mutex_lock(&table_lock); }
+static void unlock_table(void) { pthread_mutex_unlock(&table_lock); }
+
 __attribute__((constructor))
 static void init(void) {
     real_socket     = dlsym(RTLD_NEXT, "socket");
@@ -98,11 +205,44 @@ static void init(void) {
     real_accept     = dlsym(RTLD_NEXT, "accept");
     real_close      = dlsym(RTLD_NEXT, "close");
     real_read       = dlsym(RTLD_NEXT, "read");
-    for (int i = 0; i < 1024; i++) {
-        peer_of[i] = -1;
-        wake_r[i]  = -1;
-        wake_w[i]  = -1;
+    /* Keep the table lock consistent across fork(). */
+    pthread_atfork(lock_table, unlock_table, unlock_table);
+}
+
+/* Entry for fd, growing the table if needed.  Caller holds table_lock.
+   Returns NULL only if the table cannot grow. */
+static struct shim_fd *entry_for(int fd) {
+    if ((size_t)fd >= table_size) {
+        size_t size = table_size ? table_size : 1024;
+        while (size <= (size_t)fd)
+            size *= 2;
+        struct shim_fd *grown = realloc(table, size * sizeof *grown);
+        if (!grown)
+            return NULL;
+        for (size_t i = table_size; i < size; i++) {
+            grown[i].shimmed = 0;
+            grown[i].peer    = -1;
+            grown[i].wake_r  = -1;
+            grown[i].wake_w  = -1;
+        }
+        table      = grown;
+        table_size = size;
     }
+    return &table[fd];
+}
+
+/* Copy out the entry for fd; returns 0 if fd is not shimmed. */
+static int lookup(int fd, struct shim_fd *out) {
+    int found = 0;
+    if (fd < 0)
+        return 0;
+    lock_table();
+    if ((size_t)fd < table_size && table[fd].shimmed) {
+        *out  = table[fd];
+        found = 1;
+    }
+    unlock_table();
+    return found;
 }
 
 /* ---- socket ---------------------------------------------------------- */
@@ -113,15 +253,25 @@ int socket(int domain, int type, int protocol) {
         /* socket(AF_UNIX) blocked – fall back to socketpair(). */
         int sv[2];
         if (real_socketpair(domain, type, protocol, sv) == 0) {
-            if (sv[0] >= 0 && sv[0] < 1024) {
-                is_shimmed[sv[0]] = 1;
-                peer_of[sv[0]]    = sv[1];
-                int wp[2];
-                if (pipe(wp) == 0) {
-                    wake_r[sv[0]] = wp[0];
-                    wake_w[sv[0]] = wp[1];
+            int wp[2];
+            int have_pipe = pipe(wp) == 0;
+
+            lock_table();
+            struct shim_fd *e = entry_for(sv[0]);
+            if (e) {
+                e->shimmed = 1;
+                e->peer    = sv[1];
+                if (have_pipe) {
+                    e->wake_r = wp[0];
+                    e->wake_w = wp[1];
                 }
             }
+            unlock_table();
+
+            if (!e && have_pipe) {
+                real_close(wp[0]);
+                real_close(wp[1]);
+            }
             return sv[0];
         }
         errno = EPERM;
@@ -132,8 +282,11 @@ int socket(int domain, int type, int protocol) {
 
 /* ---- listen ---------------------------------------------------------- */
 int listen(int sockfd, int backlog) {
-    if (sockfd >= 0 && sockfd < 1024 && is_shimmed[sockfd]) {
+    struct shim_fd e;
+    if (lookup(sockfd, &e)) {
+        lock_table();
         listener_fd = sockfd;
+        unlock_table();
         return 0;
     }
     return real_listen(sockfd, backlog);
@@ -141,11 +294,12 @@ int listen(int sockfd, int backlog) {
 
 /* ---- accept ---------------------------------------------------------- */
 int accept(int sockfd, struct sockaddr *addr, socklen_t *addrlen) {
-    if (sockfd >= 0 && sockfd < 1024 && is_shimmed[sockfd]) {
+    struct shim_fd e;
+    if (lookup(sockfd, &e)) {
         /* Block until close() writes to the wake pipe. */
-        if (wake_r[sockfd] >= 0) {
+        if (e.wake_r >= 0) {
             char buf;
-            real_read(wake_r[sockfd], &buf, 1);
+            real_read(e.wake_r, &buf, 1);
         }
         errno = ECONNABORTED;
         return -1;
@@ -155,18 +309,31 @@ int accept(int sockfd, struct sockaddr *addr, socklen_t *addrlen) {
 
 /* ---- close ----------------------------------------------------------- */
 int close(int fd) {
-    if (fd >= 0 && fd < 1024 && is_shimmed[fd]) {
-        int was_listener = (fd == listener_fd);
-        is_shimmed[fd] = 0;
+    struct shim_fd e;
+    int shimmed = 0, was_listener = 0;
+
+    if (fd >= 0) {
+        lock_table();
+        if ((size_t)fd < table_size && table[fd].shimmed) {
+            e            = table[fd];
+            shimmed      = 1;
+            was_listener = (fd == listener_fd);
+            table[fd].shimmed = 0;
+            table[fd].peer    = -1;
+            table[fd].wake_r  = -1;
+            table[fd].wake_w  = -1;
+        }
+        unlock_table();
+    }
 
-        if (wake_w[fd] >= 0) {              /* unblock accept() */
+    if (shimmed) {
+        if (e.wake_w >= 0) {                /* unblock accept() */
             char c = 0;
-            write(wake_w[fd], &c, 1);
-            real_close(wake_w[fd]);
-            wake_w[fd] = -1;
+            write(e.wake_w, &c, 1);
+            real_close(e.wake_w);
         }
-        if (wake_r[fd] >= 0) { real_close(wake_r[fd]); wake_r[fd]  = -1; }
-        if (peer_of[fd] >= 0) { real_close(peer_of[fd]); peer_of[fd] = -1; }
+        if (e.wake_r >= 0) real_close(e.wake_r);
+        if (e.peer >= 0)   real_close(e.peer);
 
         if (was_listener)
             _exit(0);                        /* conversion done – exit */
@@ -0,0 +1,363 @@
+"""
+Pool of long-lived headless LibreOffice (soffice) processes driven over UNO.
+
+Starting soffice costs seconds, so running it once per document dominates
+batch jobs.  The pool keeps a few warm instances listening on named pipes
+and hands each job to an idle one.  Every worker runs on its own copy of
+a prebuilt profile (see office.soffice_profile).  Requires the `uno`
+Python bridge that ships with LibreOffice (python3-uno on Debian/Ubuntu).
+
+Usage:
+    from office.soffice_pool import SofficePool
+
+    with SofficePool(size=4, timeout=30) as pool:
+        pool.recalculate("report.xlsx")
+
+        futures = [pool.submit(pool.recalculate, path) for path in paths]
+"""
+
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from office.soffice import get_soffice_env
+from office.soffice_profile import prepare_profile, user_installation
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+
+class WorkerStartError(RuntimeError):
+    """A soffice worker exited or did not answer during startup."""
+
+
+def uno_available() -> bool:
+    return uno is not None
+
+
+class SofficeWorker:
+    def __init__(
+        self, index: int, startup_timeout: float = 60, template: Path | None = None
+    ):
+        self.index = index
+        self.startup_timeout = startup_timeout
+        self.template = template
+        self.pipe_name = f"lo_pool_{os.getpid()}_{index}_{uuid.uuid4().hex[:8]}"
+        self.profile_dir: Path | None = None
+        self.process: subprocess.Popen | None = None
+        self.desktop = None
+
+    def start(self) -> None:
+        self.profile_dir = Path(tempfile.mkdtemp(prefix="lo_pool_profile_"))
+        if self.template is not None:
+            # Starting from an initialized profile skips first-run setup.
+            shutil.copytree(
+                self.template, self.profile_dir, symlinks=True, dirs_exist_ok=True
+            )
+        cmd = [
+            "soffice",
+            "--headless",
+            "--invisible",
+            "--norestore",
+            "--nologo",
+            "--nodefault",
+            user_installation(self.profile_dir),
+            f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            env=get_soffice_env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        url = f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            if self.process.poll() is not None:
+                raise WorkerStartError(
+                    f"soffice worker {self.index} exited during startup "
+                    f"(code {self.process.returncode})"
+                )
+            try:
+                ctx = resolver.resolve(url)
+                break
+            except NoConnectException:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise WorkerStartError(
+                        f"soffice worker {self.index} did not start within "
+                        f"{self.startup_timeout}s"
+                    )
+                time.sleep(0.25)
+
+        self.desktop = ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", ctx
+        )
+
+    def stop(self) -> None:
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+        if self.profile_dir is not None:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+    def kill(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.desktop = None
+        self.stop()
+
+    def restart(self) -> None:
+        self.kill()
+        self.start()
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def reset_peak_rss(self) -> bool:
+        """Restart peak RSS tracking for the worker's process tree (Linux).
+
+        Returns False if any process could not be reset, in which case
+        peak_rss() still covers the worker's whole lifetime.
+        """
+        if self.process is None:
+            return False
+        try:
+            for pid in _process_tree(self.process.pid):
+                Path(f"/proc/{pid}/clear_refs").write_text("5")
+        except OSError:
+            return False
+        return True
+
+    def peak_rss(self) -> int | None:
+        """Largest peak RSS in bytes across the worker's process tree since
+        the last reset_peak_rss() (Linux)."""
+        if self.process is None:
+            return None
+        peaks = [_peak_rss(pid) for pid in _process_tree(self.process.pid)]
+        peaks = [peak for peak in peaks if peak is not None]
+        return max(peaks) if peaks else None
+
+    def call(self, job, timeout: float):
+        result = {}
+
+        def target():
+            try:
+                result["value"] = job(self.desktop)
+            except BaseException as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+
+        if thread.is_alive():
+            # Killing soffice makes the blocked UNO call raise in its thread.
+            self.kill()
+            raise TimeoutError(f"soffice job timed out after {timeout}s")
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+
+class SofficePool:
+    def __init__(
+        self,
+        size: int | None = None,
+        timeout: float = 30,
+        startup_timeout: float = 60,
+        template: Path | None = None,
+    ):
+        if uno is None:
+            raise RuntimeError(
+                "SofficePool requires the LibreOffice UNO bridge (python3-uno)"
+            )
+        self.size = max(1, size or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.template = template
+        self._workers: list[SofficeWorker] = []
+        self._idle: queue.Queue[SofficeWorker] = queue.Queue()
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._start_error: str | None = None
+
+    def __enter__(self) -> "SofficePool":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._workers:
+                return
+            if self._start_error is not None:
+                # Retrying would wait out startup_timeout again for every job
+                # until close().
+                raise WorkerStartError(self._start_error)
+            template = self.template
+            if template is None:
+                try:
+                    template = prepare_profile({})
+                except (OSError, subprocess.SubprocessError):
+                    template = None
+            workers = [
+                SofficeWorker(i, self.startup_timeout, template)
+                for i in range(self.size)
+            ]
+            with ThreadPoolExecutor(max_workers=self.size) as starter:
+                starts = [starter.submit(worker.start) for worker in workers]
+            errors = [start.exception() for start in starts]
+            if any(errors):
+                # stop() also cleans up after a worker that failed halfway.
+                for worker in workers:
+                    worker.stop()
+                error = next(error for error in errors if error)
+                self._start_error = str(error)
+                raise WorkerStartError(self._start_error) from error
+
+            self._workers = workers
+            for worker in workers:
+                self._idle.put(worker)
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.size, thread_name_prefix="soffice-pool"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+            self._idle = queue.Queue()
+            self._start_error = None
+
+    @contextmanager
+    def worker(self):
+        """Check out an idle, running worker for the duration of the block."""
+        if not self._workers:
+            self.start()
+
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                if self._start_error is not None:
+                    raise WorkerStartError(self._start_error)
+                try:
+                    worker.restart()
+                except BaseException as e:
+                    # Don't leave a half-started worker's profile behind.
+                    worker.stop()
+                    self._start_error = str(e)
+                    raise WorkerStartError(self._start_error) from e
+            yield worker
+        finally:
+            self._idle.put(worker)
+
+    def run(self, job, timeout: float | None = None):
+        """Run `job(desktop)` on an idle worker, blocking until it finishes."""
+        with self.worker() as worker:
+            return worker.call(job, timeout or self.timeout)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._workers:
+            self.start()
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def recalculate(self, path: str, timeout: float | None = None) -> dict:
+        """Recalculate and save `path`, returning per-step timings in seconds.
+
+        The result also carries the peak RSS in bytes of the worker during
+        this job, where the platform lets it be measured.
+        """
+        url = uno.systemPathToFileUrl(str(Path(path).absolute()))
+
+        def job(desktop):
+            timings = {}
+            start = time.perf_counter()
+            doc = desktop.loadComponentFromURL(
+                url, "_blank", 0, (_property("Hidden", True),)
+            )
+            timings["load"] = time.perf_counter() - start
+            try:
+                start = time.perf_counter()
+                doc.calculateAll()
+                timings["calculate_all"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                doc.store()
+                timings["store"] = time.perf_counter() - start
+            finally:
+                doc.close(True)
+            return timings
+
+        with self.worker() as worker:
+            measured = worker.reset_peak_rss()
+            timings = worker.call(job, timeout or self.timeout)
+            peak_rss = worker.peak_rss() if measured else None
+            return {"timings": timings, "peak_rss_bytes": peak_rss}
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for parent in pids:
+        try:
+            children = Path(f"/proc/{parent}/task/{parent}/children").read_text()
+        except OSError:
+            continue
+        pids.extend(int(child) for child in children.split())
+    return pids
+
+
+def _peak_rss(pid: int) -> int | None:
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def _property(name: str, value) -> "PropertyValue":
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
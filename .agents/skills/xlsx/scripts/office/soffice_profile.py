@@ -0,0 +1,140 @@
+"""
+Prebuilt, reusable LibreOffice user profiles.
+
+The first soffice start against a new profile spends seconds creating it,
+and every instance launched without -env:UserInstallation shares (and
+locks) ~/.config/libreoffice.  prepare_profile() initializes a profile
+once, installs the given files into it, and keeps it under a directory
+keyed by a fingerprint of those files and the LibreOffice version, so later
+runs only have to point soffice at it.
+
+soffice allows one instance per profile: a second one started against a
+busy profile hands its arguments over and exits.  profile_slot() checks out
+a private copy of a prepared profile so concurrent runs don't serialize on
+it; copies are made once and reused by later runs.
+
+Usage:
+    from office.soffice_profile import prepare_profile, profile_slot, user_installation
+
+    profile = prepare_profile({"user/basic/Standard/Module1.xba": macro})
+    with profile_slot(profile) as slot:
+        run_soffice([user_installation(slot), "--headless", ...])
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from itertools import count
+from pathlib import Path
+
+from office.helpers.cache_dir import cache_dir
+from office.soffice import run_soffice, soffice_version
+
+# Bump whenever the way profiles are built changes.
+PROFILE_VERSION = 1
+
+
+def default_profile_root() -> Path:
+    return cache_dir("SOFFICE_PROFILE_DIR", "soffice-profiles")
+
+
+def profile_fingerprint(files: dict[str, str]) -> str:
+    material = json.dumps(
+        {"version": PROFILE_VERSION, "libreoffice": soffice_version(), "files": files},
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()[:16]
+
+
+def prepare_profile(files: dict[str, str], root: Path | None = None) -> Path:
+    """Return an initialized profile directory containing `files`.
+
+    `files` maps paths relative to the profile directory to their contents.
+    The profile is built in a staging directory and renamed into place, so
+    a directory under its final name is always complete; concurrent callers
+    in other processes wait on a lock file instead of building it twice.
+    """
+    root = Path(root) if root else default_profile_root()
+    profile = root / profile_fingerprint(files)
+    if profile.is_dir():
+        return profile
+
+    root.mkdir(parents=True, exist_ok=True)
+    with _locked(root / f".{profile.name}.lock"):
+        if profile.is_dir():
+            return profile
+
+        staging = Path(tempfile.mkdtemp(prefix=".tmp-", dir=root))
+        try:
+            run_soffice(
+                [user_installation(staging), "--headless", "--terminate_after_init"],
+                capture_output=True,
+                timeout=60,
+            )
+            for relative, content in files.items():
+                path = staging / relative
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(content)
+            os.rename(staging, profile)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    return profile
+
+
+@contextmanager
+def profile_slot(template: Path):
+    """Check out a private copy of `template` for one soffice instance.
+
+    Slots live next to the template and are held with an exclusive lock for
+    the duration of the block; the first free one is reused, and a new one
+    is copied from the template only when all existing slots are busy.
+    """
+    template = Path(template)
+    slots = template.parent / f"{template.name}.slots"
+    slots.mkdir(exist_ok=True)
+
+    for index in count():
+        lock = open(slots / f".{index}.lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            continue
+        break
+
+    try:
+        slot = slots / str(index)
+        if not slot.is_dir():
+            staging = Path(tempfile.mkdtemp(prefix=".tmp-", dir=slots))
+            try:
+                shutil.copytree(template, staging, symlinks=True, dirs_exist_ok=True)
+                os.rename(staging, slot)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+        # We hold the slot, so a lock file soffice left behind is stale.
+        (slot / ".lock").unlink(missing_ok=True)
+        yield slot
+    finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+
+def user_installation(profile: Path) -> str:
+    return f"-env:UserInstallation={Path(profile).absolute().as_uri()}"
+
+
+@contextmanager
+def _locked(path: Path):
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -3,6 +3,8 @@
 Extracts the ZIP archive, pretty-prints XML files, and optionally:
 - Merges adjacent runs with identical formatting (DOCX only)
 - Simplifies adjacent tracked changes from same author (DOCX only)
+- Pretty-prints only the parts matching --parts, extracting the rest raw or
+  leaving them in the archive for pack.py to copy back
 
 Usage:
     python unpack.py <office_file> <output_dir> [options]
@@ -11,17 +13,24 @@ Examples:
     python unpack.py document.docx unpacked/
     python unpack.py presentation.pptx unpacked/
     python unpack.py document.docx unpacked/ --merge-runs false
+    python unpack.py book.xlsx unpacked/ --parts "xl/worksheets/*.xml" --others skip
 """
 
 import argparse
+import fnmatch
+import json
 import sys
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
 import defusedxml.minidom
 
-from helpers.merge_runs import merge_runs as do_merge_runs
-from helpers.simplify_redlines import simplify_redlines as do_simplify_redlines
+from helpers.merge_runs import merge_runs_in_dom
+from helpers.parallel import XML_SUFFIXES, largest_first, pool_size
+from helpers.simplify_redlines import simplify_redlines_in_dom
+from helpers.xml_format import pretty_print_xml
 
 SMART_QUOTE_REPLACEMENTS = {
     "\u201c": "&#x201C;",  
@@ -30,13 +39,30 @@ SMART_QUOTE_REPLACEMENTS = {
     "\u2019": "&#x2019;",  
 }
 
+DOCUMENT_PART = "word/document.xml"
+
+# Lists the parts unpack() left in the archive; pack() copies them back from
+# it instead of expecting them on disk.
+SKIPPED_PARTS_FILE = ".unpack-skipped.json"
+
 
 def unpack(
     input_file: str,
     output_directory: str,
     merge_runs: bool = True,
     simplify_redlines: bool = True,
+    parts: list[str] | None = None,
+    others: str = "raw",
+    workers: int | None = None,
 ) -> tuple[None, str]:
+    """Unpack `input_file`, pretty-printing the parts matching `parts`.
+
+    `parts` are glob patterns over part names such as "word/document.xml"
+    or "xl/worksheets/*.xml"; None selects every part.  Parts not selected
+    are extracted unchanged when `others` is "raw", or left in the archive
+    when it is "skip".  Large parts are formatted by up to `workers`
+    processes (default: CPU count).
+    """
     input_path = Path(input_file)
     output_path = Path(output_directory)
     suffix = input_path.suffix.lower()
@@ -47,30 +73,75 @@ def unpack(
     if suffix not in {".docx", ".pptx", ".xlsx"}:
         return None, f"Error: {input_file} must be a .docx, .pptx, or .xlsx file"
 
+    if others not in {"raw", "skip"}:
+        return None, f"Error: others must be 'raw' or 'skip', not {others!r}"
+
     try:
         output_path.mkdir(parents=True, exist_ok=True)
 
         with zipfile.ZipFile(input_path, "r") as zf:
-            zf.extractall(output_path)
+            names = [n for n in zf.namelist() if not n.endswith("/")]
+            selected = names
+            if parts is not None:
+                selected = [n for n in names if _selected(n, parts)]
+            extracted = zf.namelist()
+            if parts is not None and others == "skip":
+                extracted = selected
+            extracted_names = set(extracted)
+            skipped = [n for n in names if n not in extracted_names]
+            xml_parts = {n for n in selected if n.endswith(XML_SUFFIXES)}
+
+            document_options = None
+            if suffix == ".docx" and (simplify_redlines or merge_runs):
+                document_options = (simplify_redlines, merge_runs)
+
+            xml_sizes = {
+                n: zf.getinfo(n).file_size for n in extracted if n in xml_parts
+            }
+            workers = pool_size(workers, xml_sizes)
+
+            counts = []
+            pool = ProcessPoolExecutor(workers) if workers else nullcontext()
+            with pool as executor:
+                # Workers read and write their parts themselves, so at most
+                # one part per worker is held in memory.
+                futures = []
+                if executor is not None:
+                    for name in largest_first(xml_sizes):
+                        futures.append(
+                            executor.submit(
+                                _unpack_xml_part_from,
+                                input_path,
+                                output_path,
+                                name,
+                                document_options,
+                            )
+                        )
+
+                for name in extracted:
+                    if name not in xml_parts:
+                        zf.extract(name, output_path)
+                    elif executor is None:
+                        counts.append(
+                            _unpack_xml_part(zf, output_path, name, document_options)
+                        )
+                counts += [future.result() for future in futures]
+
+            simplify_count = sum(count[0] for count in counts)
+            merge_count = sum(count[1] for count in counts)
 
-        xml_files = list(output_path.rglob("*.xml")) + list(output_path.rglob("*.rels"))
-        for xml_file in xml_files:
-            _pretty_print_xml(xml_file)
+        _write_skipped_parts(output_path, input_path, skipped)
 
-        message = f"Unpacked {input_file} ({len(xml_files)} XML files)"
+        message = f"Unpacked {input_file} ({len(xml_parts)} XML files)"
+        if skipped:
+            message += f", left {len(skipped)} parts in the archive"
 
-        if suffix == ".docx":
+        if suffix == ".docx" and (parts is None or DOCUMENT_PART in xml_parts):
             if simplify_redlines:
-                simplify_count, _ = do_simplify_redlines(str(output_path))
                 message += f", simplified {simplify_count} tracked changes"
-
             if merge_runs:
-                merge_count, _ = do_merge_runs(str(output_path))
                 message += f", merged {merge_count} runs"
 
-        for xml_file in xml_files:
-            _escape_smart_quotes(xml_file)
-
         return None, message
 
     except zipfile.BadZipFile:
@@ -79,23 +150,95 @@ def unpack(
         return None, f"Error unpacking: {e}"
 
 
-def _pretty_print_xml(xml_file: Path) -> None:
+def read_skipped_parts(directory) -> tuple[str | None, list[str]]:
+    """The archive and names of parts unpack() left out of `directory`."""
     try:
-        content = xml_file.read_text(encoding="utf-8")
-        dom = defusedxml.minidom.parseString(content)
-        xml_file.write_bytes(dom.toprettyxml(indent="  ", encoding="utf-8"))
+        manifest = json.loads((Path(directory) / SKIPPED_PARTS_FILE).read_text())
+    except (OSError, ValueError):
+        return None, []
+    return manifest["source"], manifest["parts"]
+
+
+def _write_skipped_parts(output_path: Path, input_path: Path, skipped) -> None:
+    manifest = output_path / SKIPPED_PARTS_FILE
+    if skipped:
+        manifest.write_text(
+            json.dumps({"source": str(input_path.absolute()), "parts": skipped})
+        )
+    else:
+        manifest.unlink(missing_ok=True)
+
+
+def _selected(name: str, patterns: list[str]) -> bool:
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def _unpack_xml_part_from(
+    input_path: Path, output_path: Path, name: str, document_options
+) -> tuple[int, int]:
+    with zipfile.ZipFile(input_path) as zf:
+        return _unpack_xml_part(zf, output_path, name, document_options)
+
+
+def _unpack_xml_part(
+    zf: zipfile.ZipFile, output_path: Path, name: str, document_options
+) -> tuple[int, int]:
+    """Read, format and write one XML part; returns (simplified, merged) counts.
+
+    The part is read from the archive once, formatted in memory and written
+    once.  `document_options` is (simplify_redlines, merge_runs) for docx.
+    """
+    data = zf.read(name)
+    simplify_count = merge_count = 0
+    if name == DOCUMENT_PART and document_options is not None:
+        data, simplify_count, merge_count = _format_document(data, *document_options)
+    else:
+        data = _pretty_print_xml(data)
+
+    target = _part_path(output_path, name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(_escape_smart_quotes(data))
+    return simplify_count, merge_count
+
+
+def _part_path(output_path: Path, name: str) -> Path:
+    path = (output_path / name).resolve()
+    if not path.is_relative_to(output_path.resolve()):
+        raise ValueError(f"Part {name} would be written outside {output_path}")
+    return path
+
+
+def _format_document(
+    data: bytes, simplify_redlines: bool, merge_runs: bool
+) -> tuple[bytes, int, int]:
+    """Simplify redlines, merge runs and pretty-print document.xml in one tree."""
+    try:
+        dom = defusedxml.minidom.parseString(data)
+        simplify_count = simplify_redlines_in_dom(dom) if simplify_redlines else 0
+        merge_count = merge_runs_in_dom(dom) if merge_runs else 0
+        data = dom.toprettyxml(indent="  ", encoding="utf-8")
+        return data, simplify_count, merge_count
     except Exception:
-        pass  
+        return _pretty_print_xml(data), 0, 0
 
 
-def _escape_smart_quotes(xml_file: Path) -> None:
+def _pretty_print_xml(data: bytes) -> bytes:
     try:
-        content = xml_file.read_text(encoding="utf-8")
-        for char, entity in SMART_QUOTE_REPLACEMENTS.items():
-            content = content.replace(char, entity)
-        xml_file.write_text(content, encoding="utf-8")
+        return pretty_print_xml(data)
     except Exception:
-        pass
+        return data
+
+
+def _escape_smart_quotes(data: bytes) -> bytes:
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data
+    # Parts used to be read back as text, which translated newlines.
+    content = content.replace("\r\n", "\n").replace("\r", "\n")
+    for char, entity in SMART_QUOTE_REPLACEMENTS.items():
+        content = content.replace(char, entity)
+    return content.encode("utf-8")
 
 
 if __name__ == "__main__":
@@ -118,6 +261,27 @@ if __name__ == "__main__":
         metavar="true|false",
         help="Merge adjacent tracked changes from same author (DOCX only, default: true)",
     )
+    parser.add_argument(
+        "--parts",
+        nargs="+",
+        default=None,
+        metavar="PATTERN",
+        help="Only pretty-print parts matching these globs, e.g. 'xl/worksheets/*.xml' "
+        "(default: all parts)",
+    )
+    parser.add_argument(
+        "--others",
+        choices=["raw", "skip"],
+        default="raw",
+        help="With --parts: extract other parts unchanged (raw) or leave them in "
+        "the archive for pack.py to copy back (skip) (default: raw)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used to pretty-print XML parts (default: CPU count)",
+    )
     args = parser.parse_args()
 
     _, message = unpack(
@@ -125,6 +289,9 @@ if __name__ == "__main__":
         args.output_directory,
         merge_runs=args.merge_runs,
         simplify_redlines=args.simplify_redlines,
+        parts=args.parts,
+        others=args.others,
+        workers=args.workers,
     )
     print(message)
 
@@ -2,7 +2,9 @@
 Base validator with common validation logic for document files.
 """
 
+import hashlib
 import re
+import zipfile
 from pathlib import Path
 
 import defusedxml.minidom
@@ -11,6 +13,9 @@ import lxml.etree
 
 class BaseSchemaValidator:
 
+    # Bump when validation logic changes, so cached verdicts are dropped.
+    VALIDATOR_VERSION = 1
+
     IGNORED_VALIDATION_ERRORS = [
         "hyphenationZone",
         "purl.org/dc/terms",
@@ -91,10 +96,14 @@ class BaseSchemaValidator:
         "http://www.w3.org/XML/1998/namespace",
     }
 
-    def __init__(self, unpacked_dir, original_file=None, verbose=False):
+    def __init__(self, unpacked_dir, original_file=None, verbose=False, verdicts=None):
         self.unpacked_dir = Path(unpacked_dir).resolve()
         self.original_file = Path(original_file) if original_file else None
         self.verbose = verbose
+        # Optional store of per-part XSD verdicts with get(part, key) and
+        # put(part, key, verdict), e.g. pack_cache.ValidationCache.
+        self.verdicts = verdicts
+        self._schema_digests = {}
 
         self.schemas_dir = Path(__file__).parent.parent / "schemas"
 
@@ -596,6 +605,46 @@ class BaseSchemaValidator:
             return True
 
     def validate_file_against_xsd(self, xml_file, verbose=False):
+        if self.verdicts is None:
+            return self._validate_file_against_xsd(xml_file, verbose)
+
+        xml_file = Path(xml_file).resolve()
+        part = xml_file.relative_to(self.unpacked_dir).as_posix()
+        key = self._verdict_key(xml_file, part)
+        cached = self.verdicts.get(part, key)
+        if cached is not None:
+            is_valid, errors = cached
+            return is_valid, set(errors)
+
+        is_valid, errors = self._validate_file_against_xsd(xml_file, verbose)
+        self.verdicts.put(part, key, [is_valid, sorted(errors)])
+        return is_valid, errors
+
+    def _verdict_key(self, xml_file, part):
+        """Hash of everything an XSD verdict for the part depends on."""
+        schema_path = self._get_schema_path(xml_file)
+        if schema_path is not None and schema_path not in self._schema_digests:
+            self._schema_digests[schema_path] = hashlib.sha256(
+                schema_path.read_bytes()
+            ).hexdigest()
+
+        original = b""
+        if self.original_file is not None:
+            try:
+                with zipfile.ZipFile(self.original_file) as zf:
+                    original = zf.read(part)
+            except (KeyError, OSError, zipfile.BadZipFile):
+                pass
+
+        digest = hashlib.sha256(
+            f"{type(self).__name__}:{self.VALIDATOR_VERSION}:"
+            f"{self._schema_digests.get(schema_path)}".encode()
+        )
+        for data in (xml_file.read_bytes(), original):
+            digest.update(hashlib.sha256(data).digest())
+        return digest.hexdigest()
+
+    def _validate_file_against_xsd(self, xml_file, verbose=False):
         xml_file = Path(xml_file).resolve()
         unpacked_dir = self.unpacked_dir.resolve()
 
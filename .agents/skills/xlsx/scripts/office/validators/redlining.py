@@ -2,6 +2,7 @@
 Validator for tracked changes in Word documents.
 """
 
+import hashlib
 import subprocess
 import tempfile
 import zipfile
@@ -10,11 +11,18 @@ from pathlib import Path
 
 class RedliningValidator:
 
-    def __init__(self, unpacked_dir, original_docx, verbose=False, author="Claude"):
+    # Bump when validation logic changes, so cached verdicts are dropped.
+    VALIDATOR_VERSION = 1
+
+    def __init__(
+        self, unpacked_dir, original_docx, verbose=False, author="Claude", verdicts=None
+    ):
         self.unpacked_dir = Path(unpacked_dir)
         self.original_docx = Path(original_docx)
         self.verbose = verbose
         self.author = author
+        # Only passing verdicts are cached, so failures still print their diff.
+        self.verdicts = verdicts
         self.namespaces = {
             "w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
         }
@@ -28,6 +36,33 @@ class RedliningValidator:
             print(f"FAILED - Modified document.xml not found at {modified_file}")
             return False
 
+        if self.verdicts is None:
+            return self._validate(modified_file)
+
+        key = self._verdict_key(modified_file)
+        if self.verdicts.get("word/document.xml#redlining", key):
+            return True
+        valid = self._validate(modified_file)
+        if valid:
+            self.verdicts.put("word/document.xml#redlining", key, True)
+        return valid
+
+    def _verdict_key(self, modified_file):
+        original = b""
+        try:
+            with zipfile.ZipFile(self.original_docx) as zf:
+                original = zf.read("word/document.xml")
+        except (KeyError, OSError, zipfile.BadZipFile):
+            pass
+
+        digest = hashlib.sha256(
+            f"{type(self).__name__}:{self.VALIDATOR_VERSION}:{self.author}".encode()
+        )
+        for data in (modified_file.read_bytes(), original):
+            digest.update(hashlib.sha256(data).digest())
+        return digest.hexdigest()
+
+    def _validate(self, modified_file):
         try:
             import xml.etree.ElementTree as ET
 
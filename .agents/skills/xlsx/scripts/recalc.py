@@ -3,28 +3,83 @@ Excel Formula Recalculation Script
 Recalculates all formulas in an Excel file using LibreOffice
 """
 
+import argparse
+import asyncio
+import functools
+import glob
 import json
 import os
 import platform
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 
-from office.soffice import get_soffice_env
+import defusedxml.ElementTree
+
+from office.soffice import (
+    _needs_shim,
+    get_soffice_env,
+    run_soffice_async,
+    soffice_version,
+)
+from office.soffice_pool import SofficePool, WorkerStartError, uno_available
+from office.soffice_profile import prepare_profile, profile_slot, user_installation
+import formula_engine
+from formula_graph import analyze_dependencies
+from recalc_cache import RecalcCache, file_digest
+from workbook_parts import local_name, worksheet_parts
 
 from openpyxl import load_workbook
 
-MACRO_DIR_MACOS = "~/Library/Application Support/LibreOffice/4/user/basic/Standard"
-MACRO_DIR_LINUX = "~/.config/libreoffice/4/user/basic/Standard"
-MACRO_FILENAME = "Module1.xba"
+MACRO_PATH = "user/basic/Standard/Module1.xba"
+
+WORKBOOK_PATTERNS = ["*.xlsx", "*.xlsm"]
+
+EXCEL_ERRORS = [
+    "#VALUE!",
+    "#DIV/0!",
+    "#REF!",
+    "#NAME?",
+    "#NULL!",
+    "#NUM!",
+    "#N/A",
+]
+MAX_ERROR_LOCATIONS = 20
+
+ENGINES = ["libreoffice", "python"]
+
+_PROFILE_LOCK = threading.Lock()
+
+# The macro reports how long calculateAll() and store() took, in
+# milliseconds, to the file named by this environment variable.
+TIMINGS_ENV = "RECALC_TIMINGS_FILE"
 
 RECALCULATE_MACRO = """<?xml version="1.0" encoding="UTF-8"?>
 <!DOCTYPE script:module PUBLIC "-//OpenOffice.org//DTD OfficeDocument 1.0//EN" "module.dtd">
 <script:module xmlns:script="http://openoffice.org/2000/script" script:name="Module1" script:language="StarBasic">
     Sub RecalculateAndSave()
+      Dim calcStart As Long, storeStart As Long, storeEnd As Long
+      Dim timingsFile As String, fileNum As Integer
+      calcStart = GetSystemTicks()
       ThisComponent.calculateAll()
+      storeStart = GetSystemTicks()
       ThisComponent.store()
+      storeEnd = GetSystemTicks()
       ThisComponent.close(True)
+      timingsFile = Environ("RECALC_TIMINGS_FILE")
+      If timingsFile &lt;&gt; "" Then
+        fileNum = FreeFile()
+        Open timingsFile For Output As #fileNum
+        Print #fileNum, CStr(storeStart - calcStart) &amp; " " &amp; CStr(storeEnd - storeStart)
+        Close #fileNum
+      End If
     End Sub
 </script:module>"""
 
@@ -39,145 +94,719 @@ def has_gtimeout():
         return False
 
 
+@functools.lru_cache(maxsize=None)
+def _macro_profile():
+    return prepare_profile({MACRO_PATH: RECALCULATE_MACRO})
+
+
 def setup_libreoffice_macro():
-    macro_dir = os.path.expanduser(
-        MACRO_DIR_MACOS if platform.system() == "Darwin" else MACRO_DIR_LINUX
-    )
-    macro_file = os.path.join(macro_dir, MACRO_FILENAME)
+    """Prebuilt LibreOffice profile with the recalc macro installed, or None.
 
-    if (
-        os.path.exists(macro_file)
-        and "RecalculateAndSave" in Path(macro_file).read_text()
-    ):
-        return True
+    Built once per macro and LibreOffice version and reused by every later
+    run, instead of touching the user's own ~/.config/libreoffice profile.
+    """
+    try:
+        return _macro_profile()
+    except (OSError, subprocess.SubprocessError):
+        return None
 
-    if not os.path.exists(macro_dir):
-        subprocess.run(
-            ["soffice", "--headless", "--terminate_after_init"],
-            capture_output=True,
-            timeout=10,
-            env=get_soffice_env(),
-        )
-        os.makedirs(macro_dir, exist_ok=True)
 
+@contextmanager
+def _timed(timings, name):
+    start = time.perf_counter()
     try:
-        Path(macro_file).write_text(RECALCULATE_MACRO)
-        return True
-    except Exception:
-        return False
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + time.perf_counter() - start
 
 
-def recalc(filename, timeout=30):
-    if not Path(filename).exists():
-        return {"error": f"File {filename} does not exist"}
+def _run_with_rusage(cmd, env):
+    """Like subprocess.run(), but also returns the peak RSS of the process tree.
 
-    abs_path = str(Path(filename).absolute())
+    ru_maxrss from wait4() covers the child and every descendant it waited
+    for, which reaches soffice.bin through the timeout and soffice wrappers.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=stderr, env=env
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stderr.seek(0)
+        result = subprocess.CompletedProcess(
+            cmd, process.returncode, "", stderr.read().decode(errors="replace")
+        )
+
+    # Linux reports kilobytes, macOS bytes.
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return result, usage.ru_maxrss * scale
 
-    if not setup_libreoffice_macro():
+
+def _recalculate_with_soffice(abs_path, timeout, stats):
+    timings = stats["timings"]
+    with _timed(timings, "macro_setup"):
+        profile = setup_libreoffice_macro()
+    if profile is None:
         return {"error": "Failed to setup LibreOffice macro"}
 
-    cmd = [
-        "soffice",
+    with _macro_timings_file() as timings_file:
+        env = {**get_soffice_env(), TIMINGS_ENV: timings_file}
+        # Each run gets a private copy of the profile, so concurrent runs
+        # (threads or separate processes) don't hand off to one another.
+        with profile_slot(profile) as slot:
+            cmd = ["soffice"] + _macro_args(slot, abs_path)
+            if platform.system() == "Linux":
+                cmd = ["timeout", str(timeout)] + cmd
+            elif platform.system() == "Darwin" and has_gtimeout():
+                cmd = ["gtimeout", str(timeout)] + cmd
+
+            start = time.perf_counter()
+            result, stats["peak_rss_bytes"] = _run_with_rusage(cmd, env)
+            elapsed = time.perf_counter() - start
+        _record_macro_timings(timings_file, elapsed, timings)
+
+    # timeout/gtimeout exit with 124; the file was never recalculated.
+    if result.returncode == 124:
+        return {"error": f"Recalculation timed out after {timeout} seconds"}
+    if result.returncode != 0:
+        return _macro_error(result.stderr)
+
+    return None
+
+
+async def _recalculate_with_soffice_async(abs_path, timeout, stats):
+    timings = stats["timings"]
+    with _timed(timings, "macro_setup"):
+        profile = await asyncio.to_thread(setup_libreoffice_macro)
+    if profile is None:
+        return {"error": "Failed to setup LibreOffice macro"}
+
+    with _macro_timings_file() as timings_file:
+        env = {**get_soffice_env(), TIMINGS_ENV: timings_file}
+        async with _profile_slot_async(profile) as slot:
+            start = time.perf_counter()
+            try:
+                result = await run_soffice_async(
+                    _macro_args(slot, abs_path), timeout=timeout, env=env
+                )
+            except subprocess.TimeoutExpired:
+                return {"error": f"Recalculation timed out after {timeout} seconds"}
+            elapsed = time.perf_counter() - start
+        _record_macro_timings(timings_file, elapsed, timings)
+
+    if result.returncode != 0:
+        return _macro_error(result.stderr.decode(errors="replace"))
+
+    return None
+
+
+@asynccontextmanager
+async def _profile_slot_async(profile):
+    """profile_slot() without blocking the event loop.
+
+    Waiting for a free slot and copying the profile into it both block, so
+    the slot is acquired in a thread.
+    """
+    slot = profile_slot(profile)
+    acquire = asyncio.ensure_future(asyncio.to_thread(slot.__enter__))
+    try:
+        path = await asyncio.shield(acquire)
+    except asyncio.CancelledError:
+        # The thread still takes the slot; give it back once it has.
+        def release(done):
+            if done.exception() is None:
+                slot.__exit__(None, None, None)
+
+        acquire.add_done_callback(release)
+        raise
+    try:
+        yield path
+    finally:
+        slot.__exit__(None, None, None)
+
+
+def _macro_args(profile, abs_path):
+    return [
+        user_installation(profile),
         "--headless",
         "--norestore",
         "vnd.sun.star.script:Standard.Module1.RecalculateAndSave?language=Basic&location=application",
         abs_path,
     ]
 
-    if platform.system() == "Linux":
-        cmd = ["timeout", str(timeout)] + cmd
-    elif platform.system() == "Darwin" and has_gtimeout():
-        cmd = ["gtimeout", str(timeout)] + cmd
 
-    result = subprocess.run(cmd, capture_output=True, text=True, env=get_soffice_env())
+def _macro_error(stderr):
+    error_msg = stderr or "Unknown error during recalculation"
+    if "Module1" in error_msg or "RecalculateAndSave" not in error_msg:
+        return {"error": "LibreOffice macro not configured properly"}
+    return {"error": error_msg}
 
-    if result.returncode != 0 and result.returncode != 124:  
-        error_msg = result.stderr or "Unknown error during recalculation"
-        if "Module1" in error_msg or "RecalculateAndSave" not in error_msg:
-            return {"error": "LibreOffice macro not configured properly"}
-        return {"error": error_msg}
 
+@contextmanager
+def _macro_timings_file():
+    fd, timings_file = tempfile.mkstemp(prefix="recalc-timings-", suffix=".txt")
+    os.close(fd)
     try:
-        wb = load_workbook(filename, data_only=True)
-
-        excel_errors = [
-            "#VALUE!",
-            "#DIV/0!",
-            "#REF!",
-            "#NAME?",
-            "#NULL!",
-            "#NUM!",
-            "#N/A",
-        ]
-        error_details = {err: [] for err in excel_errors}
-        total_errors = 0
+        yield timings_file
+    finally:
+        os.unlink(timings_file)
+
+
+def _record_macro_timings(timings_file, elapsed, timings):
+    macro_timings = Path(timings_file).read_text().split()
+    if len(macro_timings) == 2:
+        timings["calculate_all"] = int(macro_timings[0]) / 1000
+        timings["store"] = int(macro_timings[1]) / 1000
+        # Whatever the macro did not account for: process startup, loading
+        # the document and shutdown.
+        timings["soffice_startup"] = max(
+            0, elapsed - timings["calculate_all"] - timings["store"]
+        )
+    else:
+        timings["soffice_startup"] = elapsed
 
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            for row in ws.iter_rows():
-                for cell in row:
-                    if cell.value is not None and isinstance(cell.value, str):
-                        for err in excel_errors:
-                            if err in cell.value:
-                                location = f"{sheet_name}!{cell.coordinate}"
-                                error_details[err].append(location)
-                                total_errors += 1
-                                break
 
-        wb.close()
+def _recalculate_with_pool(pool, abs_path, timeout, stats):
+    try:
+        worker_stats = pool.recalculate(abs_path, timeout=timeout)
+    except WorkerStartError:
+        raise
+    except TimeoutError:
+        return {"error": f"Recalculation timed out after {timeout} seconds"}
+    except Exception as e:
+        return {"error": f"LibreOffice worker failed: {e}"}
+    stats["timings"].update(worker_stats["timings"])
+    stats["peak_rss_bytes"] = worker_stats["peak_rss_bytes"]
+    return None
+
+
+def recalc(
+    filename,
+    timeout=30,
+    pool=None,
+    max_locations=MAX_ERROR_LOCATIONS,
+    cache=None,
+    engine="libreoffice",
+    analyze_deps=False,
+    profile=None,
+):
+    stats = {"timings": {}}
+    with _timed(stats["timings"], "total"):
+        steps = _recalc_steps(
+            filename, timeout, max_locations, cache, engine, analyze_deps, stats
+        )
+        done, value = _advance(steps)
+        if not done:
+            if pool is not None:
+                try:
+                    error = _recalculate_with_pool(pool, value, timeout, stats)
+                except WorkerStartError:
+                    # A pool that cannot start fails fast from then on, so
+                    # the rest of a batch goes through one-shot soffice runs.
+                    pool = None
+            if pool is None:
+                error = _recalculate_with_soffice(value, timeout, stats)
+            done, value = _advance(steps, error)
+
+    return _finish(value, stats, filename, engine, profile)
+
+
+async def recalc_async(
+    filename,
+    timeout=30,
+    max_locations=MAX_ERROR_LOCATIONS,
+    cache=None,
+    engine="libreoffice",
+    analyze_deps=False,
+    profile=None,
+):
+    """Asyncio counterpart of recalc() for running many workbooks on one loop.
+
+    soffice runs as an asyncio subprocess, killed on timeout or when the task
+    is cancelled; cache lookups and scanning run in the default executor.
+    """
+    stats = {"timings": {}}
+    with _timed(stats["timings"], "total"):
+        steps = _recalc_steps(
+            filename, timeout, max_locations, cache, engine, analyze_deps, stats
+        )
+        done, value = await asyncio.to_thread(_advance, steps)
+        if not done:
+            error = await _recalculate_with_soffice_async(value, timeout, stats)
+            done, value = await asyncio.to_thread(_advance, steps, error)
 
-        result = {
-            "status": "success" if total_errors == 0 else "errors_found",
-            "total_errors": total_errors,
-            "error_summary": {},
+    return _finish(value, stats, filename, engine, profile)
+
+
+def _advance(steps, value=None):
+    """Resume `steps` with `value`: (False, yielded) or (True, returned)."""
+    try:
+        return False, steps.send(value)
+    except StopIteration as done:
+        return True, done.value
+
+
+def _finish(result, stats, filename, engine, profile):
+    if "error" not in result:
+        result["timings"] = {
+            name: round(seconds, 3) for name, seconds in stats["timings"].items()
         }
+        if stats.get("peak_rss_bytes") is not None:
+            result["peak_rss_bytes"] = stats["peak_rss_bytes"]
+    if profile is not None:
+        _write_profile(profile, filename, engine, result, stats)
+    return result
 
-        for err_type, locations in error_details.items():
-            if locations:
-                result["error_summary"][err_type] = {
-                    "count": len(locations),
-                    "locations": locations[:20],  
-                }
 
-        wb_formulas = load_workbook(filename, data_only=False)
-        formula_count = 0
-        for sheet_name in wb_formulas.sheetnames:
-            ws = wb_formulas[sheet_name]
-            for row in ws.iter_rows():
-                for cell in row:
-                    if (
-                        cell.value
-                        and isinstance(cell.value, str)
-                        and cell.value.startswith("=")
-                    ):
-                        formula_count += 1
-        wb_formulas.close()
+def _recalc_steps(filename, timeout, max_locations, cache, engine, analyze_deps, stats):
+    """recalc() minus the LibreOffice run, which sync and async callers drive.
 
-        result["total_formulas"] = formula_count
+    Yields the absolute path once LibreOffice has to recalculate it and
+    expects the resulting error dict (or None) back; returns the report.
+    """
+    if not Path(filename).exists():
+        return {"error": f"File {filename} does not exist"}
+
+    abs_path = str(Path(filename).absolute())
+
+    cache_options = {
+        "timeout": timeout,
+        "max_locations": max_locations,
+        "engine": engine,
+        "analyze_deps": analyze_deps,
+    }
+    if cache is not None:
+        with _timed(stats["timings"], "cache_lookup"):
+            input_key = cache.key(file_digest(abs_path), **cache_options)
+            cached = cache.get(input_key, abs_path)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    fallback = None
+    if engine == "python":
+        try:
+            with _timed(stats["timings"], "python_engine"):
+                formula_engine.recalculate(abs_path)
+        except formula_engine.UnsupportedFormula as e:
+            fallback = str(e)
+        except Exception as e:
+            return {"error": str(e)}
+
+    if engine != "python" or fallback is not None:
+        error = yield abs_path
+        if error:
+            return error
+
+    if cache is not None:
+        # Also key the entry by the recalculated output, which is what sits
+        # on disk the next time the same workbook is checked.
+        keys = [input_key, cache.key(file_digest(abs_path), **cache_options)]
 
-        return result
+    try:
+        try:
+            previous = None
+            if cache is not None:
+                previous = cache.load_manifest(abs_path, max_locations=max_locations)
+            sheets = _scan_sheets(abs_path, max_locations, previous, stats["timings"])
+            sheet_results = {name: sheet["result"] for name, sheet in sheets.items()}
+            if cache is not None:
+                cache.save_manifest(
+                    abs_path, sheets, keys, max_locations=max_locations
+                )
+        except KeyError:
+            sheet_results = _scan_workbook_openpyxl(
+                filename, max_locations, stats["timings"]
+            )
+        result = _build_report(sheet_results, max_locations)
+        if engine == "python":
+            result["engine"] = "libreoffice" if fallback else "python"
+            if fallback:
+                result["engine_fallback"] = fallback
+        if analyze_deps:
+            try:
+                with _timed(stats["timings"], "analyze_deps"):
+                    result["dependencies"] = analyze_dependencies(abs_path)
+            except Exception as e:
+                result["dependencies"] = {"error": str(e)}
 
     except Exception as e:
         return {"error": str(e)}
 
+    if cache is not None:
+        cache.put(keys, abs_path, result)
+
+    return result
+
+
+def _write_profile(path, filename, engine, result, stats):
+    """Append one JSON Lines record per recalculated workbook to `path`."""
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "file": str(filename),
+        "libreoffice": soffice_version(),
+        "engine": result.get("engine", engine),
+        "status": result.get("status", "failed"),
+        "cached": result.get("cached", False),
+        "timings": {
+            name: round(seconds, 3) for name, seconds in stats["timings"].items()
+        },
+        "peak_rss_bytes": stats.get("peak_rss_bytes"),
+    }
+    if "error" in result:
+        record["error"] = result["error"]
+
+    with _PROFILE_LOCK, open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def scan_workbook(filename, max_locations=MAX_ERROR_LOCATIONS):
+    """Count formulas and collect error cells per sheet in one streaming pass.
+
+    Reads the worksheet parts straight out of the zip instead of loading the
+    workbook, so memory stays flat regardless of row count.
+    """
+    sheets = _scan_sheets(filename, max_locations)
+    return {name: sheet["result"] for name, sheet in sheets.items()}
+
+
+def _scan_sheets(
+    filename, max_locations=MAX_ERROR_LOCATIONS, previous=None, timings=None
+):
+    """Scan each worksheet, reusing `previous` results for unchanged parts.
+
+    A sheet counts as unchanged when its part name, CRC and size in the zip
+    central directory match the previous manifest, so only edited sheets are
+    parsed again.
+    """
+    previous = previous or {}
+    timings = {} if timings is None else timings
+    sheets = {}
+
+    with _timed(timings, "load_for_scan"):
+        zf = zipfile.ZipFile(filename)
+    with zf, _timed(timings, "scan"):
+        for sheet_name, part in worksheet_parts(zf):
+            info = zf.getinfo(part)
+            fingerprint = {"part": part, "crc": info.CRC, "size": info.file_size}
+
+            cached = previous.get(sheet_name)
+            if cached and all(cached.get(k) == v for k, v in fingerprint.items()):
+                result = cached["result"]
+            else:
+                result = _scan_sheet_xml(zf, part, sheet_name, max_locations)
+
+            sheets[sheet_name] = {**fingerprint, "result": result}
+
+    return sheets
+
+
+def _scan_sheet_xml(zf, part, sheet_name, max_locations=MAX_ERROR_LOCATIONS):
+    formulas = 0
+    errors = {}
+    sheet_data = None
+
+    with zf.open(part) as f:
+        for event, elem in defusedxml.ElementTree.iterparse(
+            f, events=("start", "end")
+        ):
+            tag = local_name(elem.tag)
+            if event == "start":
+                if tag == "sheetData":
+                    sheet_data = elem
+                continue
+
+            if tag == "f":
+                formulas += 1
+            elif tag == "c" and elem.get("t") == "e":
+                value = next(
+                    (child.text for child in elem if local_name(child.tag) == "v"),
+                    None,
+                )
+                if value:
+                    details = errors.setdefault(value, {"count": 0, "locations": []})
+                    details["count"] += 1
+                    if len(details["locations"]) < max_locations:
+                        details["locations"].append(f"{sheet_name}!{elem.get('r')}")
+            elif tag == "row" and sheet_data is not None:
+                sheet_data.remove(elem)
+
+    return {"formulas": formulas, "errors": errors}
+
+
+def _scan_workbook_openpyxl(
+    filename, max_locations=MAX_ERROR_LOCATIONS, timings=None
+):
+    timings = {} if timings is None else timings
+    sheet_results = {}
+
+    with _timed(timings, "load_for_scan"):
+        wb = load_workbook(filename, read_only=True, data_only=True)
+    with _timed(timings, "scan"):
+        for sheet_name in wb.sheetnames:
+            errors = {}
+            for row in wb[sheet_name].iter_rows():
+                for cell in row:
+                    if cell.data_type != "e" or not cell.value:
+                        continue
+                    details = errors.setdefault(
+                        cell.value, {"count": 0, "locations": []}
+                    )
+                    details["count"] += 1
+                    if len(details["locations"]) < max_locations:
+                        details["locations"].append(f"{sheet_name}!{cell.coordinate}")
+            sheet_results[sheet_name] = {"formulas": 0, "errors": errors}
+        wb.close()
+
+    with _timed(timings, "load_for_scan"):
+        wb_formulas = load_workbook(filename, read_only=True, data_only=False)
+    with _timed(timings, "scan"):
+        for sheet_name in wb_formulas.sheetnames:
+            sheet_results[sheet_name]["formulas"] = sum(
+                1
+                for row in wb_formulas[sheet_name].iter_rows()
+                for cell in row
+                if cell.data_type == "f"
+            )
+        wb_formulas.close()
+
+    return sheet_results
+
+
+def _build_report(sheet_results, max_locations=MAX_ERROR_LOCATIONS):
+    error_summary = {}
+    total_errors = 0
+    total_formulas = 0
+
+    for sheet in sheet_results.values():
+        total_formulas += sheet["formulas"]
+        for err, details in sheet["errors"].items():
+            summary = error_summary.setdefault(err, {"count": 0, "locations": []})
+            summary["count"] += details["count"]
+            summary["locations"].extend(details["locations"])
+            total_errors += details["count"]
+
+    for summary in error_summary.values():
+        summary["locations"] = summary["locations"][:max_locations]
+
+    ordered = {err: error_summary.pop(err) for err in EXCEL_ERRORS if err in error_summary}
+    ordered.update(error_summary)
+
+    return {
+        "status": "success" if total_errors == 0 else "errors_found",
+        "total_errors": total_errors,
+        "error_summary": ordered,
+        "total_formulas": total_formulas,
+    }
+
+
+def collect_workbooks(target):
+    path = Path(target)
+    if path.is_dir():
+        files = [
+            f
+            for pattern in WORKBOOK_PATTERNS
+            for f in path.rglob(pattern)
+        ]
+    else:
+        files = [Path(f) for f in glob.glob(target, recursive=True)]
+
+    return sorted(
+        {f for f in files if f.is_file() and not f.name.startswith("~$")}
+    )
+
+
+def recalc_batch(
+    filenames,
+    timeout=30,
+    workers=None,
+    max_locations=MAX_ERROR_LOCATIONS,
+    cache=None,
+    engine="libreoffice",
+    analyze_deps=False,
+    profile=None,
+):
+    """Recalculate many workbooks, yielding (filename, result) as each finishes."""
+    workers = max(1, workers or os.cpu_count() or 1)
+
+    # The pool starts its soffice workers on first use, so a batch that the
+    # Python engine handles entirely never launches LibreOffice.  Without
+    # AF_UNIX sockets the shim keeps one-shot runs working, but not the
+    # named pipes pool workers listen on.
+    pool = None
+    if uno_available() and not _needs_shim():
+        pool = SofficePool(size=workers, timeout=timeout)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    recalc,
+                    str(f),
+                    timeout,
+                    pool,
+                    max_locations,
+                    cache,
+                    engine,
+                    analyze_deps,
+                    profile,
+                ): f
+                for f in filenames
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def _summarize(results, elapsed):
+    summary = {
+        "files": len(results),
+        "success": 0,
+        "errors_found": 0,
+        "failed": 0,
+        "total_errors": 0,
+        "total_formulas": 0,
+        "elapsed_seconds": round(elapsed, 3),
+    }
+    for result in results:
+        if "error" in result:
+            summary["failed"] += 1
+            continue
+        summary[result["status"]] += 1
+        summary["total_errors"] += result["total_errors"]
+        summary["total_formulas"] += result["total_formulas"]
+    return summary
+
+
+def run_batch(
+    target, timeout, workers, max_locations, cache, engine, analyze_deps, profile
+):
+    filenames = collect_workbooks(target)
+    if not filenames:
+        print(json.dumps({"error": f"No workbooks found for {target}"}))
+        return 1
+
+    start = time.monotonic()
+    results = []
+    for filename, result in recalc_batch(
+        filenames,
+        timeout,
+        workers,
+        max_locations,
+        cache,
+        engine,
+        analyze_deps,
+        profile,
+    ):
+        results.append(result)
+        print(json.dumps({"file": str(filename), **result}), flush=True)
+
+    summary = _summarize(results, time.monotonic() - start)
+    print(json.dumps({"summary": summary}), flush=True)
+    return 0 if summary["failed"] == 0 else 1
+
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python recalc.py <excel_file> [timeout_seconds]")
-        print("\nRecalculates all formulas in an Excel file using LibreOffice")
-        print("\nReturns JSON with error details:")
-        print("  - status: 'success' or 'errors_found'")
-        print("  - total_errors: Total number of Excel errors found")
-        print("  - total_formulas: Number of formulas in the file")
-        print("  - error_summary: Breakdown by error type with locations")
-        print("    - #VALUE!, #DIV/0!, #REF!, #NAME?, #NULL!, #NUM!, #N/A")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Recalculates all formulas in an Excel file using LibreOffice",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""Returns JSON with error details:
+  - status: 'success' or 'errors_found'
+  - total_errors: Total number of Excel errors found
+  - total_formulas: Number of formulas in the file
+  - error_summary: Breakdown by error type with locations
+    - #VALUE!, #DIV/0!, #REF!, #NAME?, #NULL!, #NUM!, #N/A
+  - dependencies: Formula dependency analysis (with --analyze-deps)
+  - timings: Seconds spent per step; peak_rss_bytes: soffice peak memory
+
+When given a directory or glob, prints one JSON object per workbook
+(JSON Lines) as each finishes, followed by a {"summary": ...} line.""",
+    )
+    parser.add_argument(
+        "excel_file", help="Excel file, directory, or glob (e.g. 'reports/**/*.xlsx')"
+    )
+    parser.add_argument(
+        "timeout_seconds",
+        nargs="?",
+        type=int,
+        default=30,
+        help="Per-file recalculation timeout (default: 30)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parallel workers for directory/glob input (default: CPU count)",
+    )
+    parser.add_argument(
+        "--max-locations",
+        type=int,
+        default=MAX_ERROR_LOCATIONS,
+        help=f"Cell locations collected per error type (default: {MAX_ERROR_LOCATIONS})",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="libreoffice",
+        help="Recalculation backend; 'python' evaluates common formulas without "
+        "LibreOffice and falls back to it for anything unsupported "
+        "(default: libreoffice)",
+    )
+    parser.add_argument(
+        "--analyze-deps",
+        action="store_true",
+        help="Report circular references, the longest dependency chains and "
+        "the most referenced ranges",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="LOG",
+        default=None,
+        help="Append per-file timings and peak memory to LOG as JSON Lines",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always recalculate, ignoring and not updating the result cache",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Result cache directory (default: $RECALC_CACHE_DIR or ~/.cache/recalc)",
+    )
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else RecalcCache(args.cache_dir)
+
+    if Path(args.excel_file).is_file():
+        result = recalc(
+            args.excel_file,
+            args.timeout_seconds,
+            max_locations=args.max_locations,
+            cache=cache,
+            engine=args.engine,
+            analyze_deps=args.analyze_deps,
+            profile=args.profile,
+        )
+        print(json.dumps(result, indent=2))
+        return
 
-    filename = sys.argv[1]
-    timeout = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    if not Path(args.excel_file).is_dir() and not glob.has_magic(args.excel_file):
+        print(json.dumps({"error": f"File {args.excel_file} does not exist"}, indent=2))
+        sys.exit(1)
 
-    result = recalc(filename, timeout)
-    print(json.dumps(result, indent=2))
+    sys.exit(
+        run_batch(
+            args.excel_file,
+            args.timeout_seconds,
+            args.workers,
+            args.max_locations,
+            cache,
+            args.engine,
+            args.analyze_deps,
+            args.profile,
+        )
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+"""
+On-disk result cache for recalc.py.
+
+Entries are keyed by the SHA-256 of the workbook contents plus the
+LibreOffice version and recalc options, and hold the recalculated workbook
+together with its JSON report.  The cache is bounded in size and evicts the
+least recently used entries first; per-file scan manifests count toward the
+bound and go away with the last entry they were saved with.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from office.helpers.cache_dir import cache_dir
+from office.soffice import soffice_version
+
+# Bump whenever the report format or the recalculation itself changes.
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+OUTPUT_NAME = "output"
+REPORT_NAME = "report.json"
+MANIFEST_DIR = ".manifests"
+
+
+def default_cache_dir() -> Path:
+    return cache_dir("RECALC_CACHE_DIR", "recalc")
+
+
+def file_digest(filename) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RecalcCache:
+    def __init__(self, directory=None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory) if directory else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def key(self, content_digest: str, **options) -> str:
+        material = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "libreoffice": soffice_version(),
+                "content": content_digest,
+                **options,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key: str, filename) -> dict | None:
+        """Restore the cached workbook over `filename` and return its report."""
+        entry = self.directory / key
+        try:
+            report = json.loads((entry / REPORT_NAME).read_text())
+            _atomic_copy(entry / OUTPUT_NAME, Path(filename))
+        except (OSError, ValueError):
+            return None
+
+        now = time.time()
+        try:
+            os.utime(entry, (now, now))
+        except OSError:
+            pass
+        return report
+
+    def put(self, keys: list[str], filename, report: dict) -> None:
+        """Store the recalculated `filename` and its report under every key."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stored = None
+
+        for key in dict.fromkeys(keys):
+            entry = self.directory / key
+            if entry.exists():
+                continue
+
+            staging = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.directory))
+            try:
+                # Never link the caller's file: in-place saves would corrupt
+                # the entry.  Later keys for the same output share its bytes.
+                if stored is None:
+                    shutil.copyfile(filename, staging / OUTPUT_NAME)
+                else:
+                    _link_or_copy(stored, staging / OUTPUT_NAME)
+                (staging / REPORT_NAME).write_text(json.dumps(report))
+                os.rename(staging, entry)
+                stored = entry / OUTPUT_NAME
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict()
+
+    def load_manifest(self, filename, **options) -> dict | None:
+        """Per-sheet part fingerprints and scan results from the last run."""
+        try:
+            manifest = json.loads(self._manifest_path(filename).read_text())
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != CACHE_VERSION or manifest.get("options") != options:
+            return None
+        return manifest["sheets"]
+
+    def save_manifest(
+        self, filename, sheets: dict, entries: list[str], **options
+    ) -> None:
+        """Save the scan of `filename`, kept while any of `entries` is cached."""
+        path = self._manifest_path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "options": options,
+                "entries": entries,
+                "sheets": sheets,
+            }
+        )
+
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            Path(tmp).unlink(missing_ok=True)
+
+    def _manifest_path(self, filename) -> Path:
+        name = hashlib.sha256(str(Path(filename).absolute()).encode()).hexdigest()
+        return self.directory / MANIFEST_DIR / f"{name}.json"
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        seen_inodes = set()
+        for entry in self.directory.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                size = 0
+                for f in entry.iterdir():
+                    stat = f.stat()
+                    if (stat.st_dev, stat.st_ino) not in seen_inodes:
+                        seen_inodes.add((stat.st_dev, stat.st_ino))
+                        size += stat.st_size
+                entries.append((entry.stat().st_mtime, size, entry))
+                total += size
+            except OSError:
+                continue
+
+        # A manifest is kept while any entry it was saved with is cached.
+        live = {entry.name for _, _, entry in entries}
+        manifests = {}
+        for path, size, keys in self._manifests():
+            keys = live.intersection(keys)
+            if keys:
+                manifests[path] = (size, keys)
+                total += size
+            else:
+                path.unlink(missing_ok=True)
+
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            for path, (manifest_size, keys) in list(manifests.items()):
+                keys.discard(entry.name)
+                if not keys:
+                    path.unlink(missing_ok=True)
+                    total -= manifest_size
+                    del manifests[path]
+
+    def _manifests(self):
+        """Yield (path, size, entry keys) for every saved manifest."""
+        for path in (self.directory / MANIFEST_DIR).glob("*.json"):
+            try:
+                data = path.read_bytes()
+            except OSError:
+                continue
+            try:
+                keys = [k for k in json.loads(data)["entries"] if isinstance(k, str)]
+            except (ValueError, KeyError, TypeError):
+                keys = []
+            yield path, len(data), keys
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _atomic_copy(source: Path, destination: Path) -> None:
+    fd, tmp = tempfile.mkstemp(prefix=".recalc-", dir=destination.parent)
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp)
+        if destination.exists():
+            shutil.copymode(destination, tmp)
+        os.replace(tmp, destination)
+    except BaseException:
+        os.unlink(tmp)
+        raise
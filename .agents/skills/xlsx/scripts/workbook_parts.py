@@ -0,0 +1,88 @@
+"""
+Locate SpreadsheetML parts inside an .xlsx/.xlsm package.
+
+Resolves the workbook, its worksheets and shared strings through the
+package relationships rather than assuming the default part names.
+"""
+
+import posixpath
+
+import defusedxml.ElementTree
+
+OFFICE_DOCUMENT_REL = "/officeDocument"
+WORKSHEET_REL = "/worksheet"
+SHARED_STRINGS_REL = "/sharedStrings"
+
+
+def workbook_part(zf) -> str:
+    return _resolve_target(
+        "", read_relationships(zf, "_rels/.rels"), OFFICE_DOCUMENT_REL
+    )
+
+
+def workbook_relationships(zf) -> list:
+    part = workbook_part(zf)
+    rels_part = posixpath.join(
+        posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels"
+    )
+    return read_relationships(zf, rels_part)
+
+
+def worksheet_parts(zf) -> list[tuple[str, str]]:
+    """(sheet name, part name) for every worksheet, in workbook order.
+
+    Raises KeyError when the package layout cannot be resolved.
+    """
+    part = workbook_part(zf)
+    workbook_dir = posixpath.dirname(part)
+    rels = {rel.get("Id"): rel for rel in workbook_relationships(zf)}
+
+    root = defusedxml.ElementTree.fromstring(zf.read(part))
+    parts = []
+    for sheet in root.iter():
+        if local_name(sheet.tag) != "sheet":
+            continue
+        rel_id = next(
+            (value for key, value in sheet.attrib.items() if local_name(key) == "id"),
+            None,
+        )
+        rel = rels[rel_id]
+        if not rel.get("Type", "").endswith(WORKSHEET_REL):
+            continue
+        parts.append((sheet.get("name"), part_name(workbook_dir, rel.get("Target"))))
+
+    for _, sheet_part in parts:
+        zf.getinfo(sheet_part)
+    return parts
+
+
+def shared_strings_part(zf) -> str | None:
+    workbook_dir = posixpath.dirname(workbook_part(zf))
+    try:
+        return _resolve_target(
+            workbook_dir, workbook_relationships(zf), SHARED_STRINGS_REL
+        )
+    except KeyError:
+        return None
+
+
+def read_relationships(zf, part) -> list:
+    root = defusedxml.ElementTree.fromstring(zf.read(part))
+    return [rel for rel in root if local_name(rel.tag) == "Relationship"]
+
+
+def part_name(base_dir: str, target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+
+def local_name(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _resolve_target(base_dir, rels, rel_type):
+    for rel in rels:
+        if rel.get("Type", "").endswith(rel_type):
+            return part_name(base_dir, rel.get("Target"))
+    raise KeyError(rel_type)